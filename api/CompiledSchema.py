@@ -0,0 +1,117 @@
+# api/CompiledSchema.py
+#
+# Function input/output schemas compiled once per distinct schema: the
+# cleaned schema OpenAI structured outputs accept, plus a reusable
+# validator. The SDK has a matching module, aetherllm/AetherSchema.py;
+# tests/test_schema.py checks the two stay in step.
+
+import hashlib
+import json
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import jsonschema
+
+from cache import LRUCache
+from config import SCHEMA_CACHE_SIZE
+
+# Optional: generated-code validators when fastjsonschema is installed
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# Dashboard annotations that aren't JSON Schema
+ANNOTATION_KEYS = ("title", "metrics", "desiredProperties")
+
+
+def _canonical(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    return str(obj)
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    payload = json.dumps(schema, sort_keys=True, separators=(",", ":"), default=_canonical)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def clean_schema(schema: Any) -> Any:
+    """Strip annotations and make every object strict, as structured outputs require."""
+    if not isinstance(schema, dict):
+        return schema
+    schema = {k: v for k, v in schema.items() if k not in ANNOTATION_KEYS}
+    if "properties" in schema:
+        schema["properties"] = {k: clean_schema(v) for k, v in schema["properties"].items()}
+        if "required" not in schema:
+            schema["required"] = list(schema["properties"].keys())
+    if "items" in schema:
+        schema["items"] = clean_schema(schema["items"])
+    if schema.get("type") == "object" or "properties" in schema:
+        schema["additionalProperties"] = False
+    return schema
+
+
+class CompiledSchema:
+    def __init__(self, schema: Dict[str, Any], hash: str = None):
+        self.schema = schema
+        self.hash = hash or schema_hash(schema)
+        self.cleaned = clean_schema(schema)
+        # Validate against the schema as written; cleaning only tightens
+        # what the model may produce
+        validated = _canonical_schema(schema)
+        if fastjsonschema is not None:
+            self._fast = fastjsonschema.compile(validated)
+            self._validator = None
+        else:
+            self._fast = None
+            self._validator = jsonschema.validators.validator_for(validated)(validated)
+
+    def openai_definition(self, name: str) -> Dict[str, Any]:
+        return {"name": name, "schema": self.cleaned, "strict": True}
+
+    def validate(self, value: Any) -> List[str]:
+        """Return a message per problem with `value`; empty if it is valid."""
+        if self._fast is not None:
+            try:
+                self._fast(value)
+            except fastjsonschema.JsonSchemaException as e:
+                return [e.message]
+            return []
+        return [
+            f"{'/'.join(str(p) for p in error.absolute_path) or '<root>'}: {error.message}"
+            for error in self._validator.iter_errors(value)
+        ]
+
+
+def _canonical_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    # Schemas read from DynamoDB carry Decimals, which validators can't use
+    return json.loads(json.dumps(schema, default=_canonical))
+
+
+compiled_schema_cache = LRUCache(SCHEMA_CACHE_SIZE)
+
+
+def compile_schema(schema: Dict[str, Any]) -> CompiledSchema:
+    key = schema_hash(schema)
+    compiled = compiled_schema_cache.get(key)
+    if compiled is None:
+        compiled = CompiledSchema(schema, key)
+        compiled_schema_cache.set(key, compiled)
+    return compiled
+
+
+# Statuses of a call whose inputs and outputs are final. Earlier ones
+# ("pending", "running") are filled in one field at a time, so a call is
+# only checked once it reaches one of these.
+FINISHED_STATUSES = ("complete", "completed", "evaluated")
+
+
+def call_schema_errors(function: Dict[str, Any], inputs: Any, outputs: Any) -> List[str]:
+    """Problems with a call's inputs and outputs under its function's schemas."""
+    errors = []
+    if function.get("input_schema") and inputs is not None:
+        errors += [f"input {e}" for e in compile_schema(function["input_schema"]).validate(inputs)]
+    if function.get("output_schema") and outputs is not None:
+        errors += [f"output {e}" for e in compile_schema(function["output_schema"]).validate(outputs)]
+    return errors
@@ -1,45 +1,225 @@
 # api/evaluation.py
 
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import (
+    EVALUATION_TEST_TIMEOUT,
+    EVALUATION_CACHE_SIZE,
+    EVALUATION_CACHE_TTL,
+    EVALUATION_CACHE_TABLE,
+    EVALUATION_BATCH_MAX_ITEMS,
+    EVALUATION_BATCH_MAX_TOKENS,
+)
+import asyncio
+import copy
+import hashlib
 import json
 import uuid
 from datetime import datetime
-from models import EvaluationOutput
+from decimal import Decimal
+from cache import LRUCache
+from models import EvaluationOutput, BatchEvaluationOutput
 from Prompts import eval_prompt
+from utils import get_cached_evaluation, save_cached_evaluation
+from openai_client import chat_completion
 
-client = OpenAI()
-client.api_key = OPENAI_API_KEY
 MODEL = "gpt-4o-mini"
+# Bump when the grading prompt in evaluate_output changes, so cached
+# evaluations from the old prompt are no longer used
+PROMPT_VERSION = 1
 
+# Graded results keyed by evaluation_cache_key(); the persistent tier in
+# utils is consulted on a miss when EVALUATION_CACHE_TABLE is set
+evaluation_cache = LRUCache(EVALUATION_CACHE_SIZE, ttl=EVALUATION_CACHE_TTL)
+persistent_cache_stats = {"hits": 0, "misses": 0, "errors": 0}
 
-def evaluate_function(function, version, tests, user_api_key):
-    output = []
+
+def _canonical(obj):
+    # Numbers read back from DynamoDB hash the same as the floats sent in
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    return str(obj)
+
+
+def evaluation_cache_key(task, metrics, input, output):
+    payload = json.dumps(
+        {
+            "model": MODEL,
+            "prompt_version": PROMPT_VERSION,
+            "system_prompt": hashlib.sha256(eval_prompt.encode()).hexdigest(),
+            "task": task,
+            "metrics": list(metrics),
+            "input": input,
+            "output": output,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=_canonical,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def evaluation_cache_stats():
+    stats = evaluation_cache.stats()
+    stats["persistent"] = dict(persistent_cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = (
+        (stats["hits"] + persistent_cache_stats["hits"]) / lookups if lookups else 0.0
+    )
+    return stats
+
+
+def test_batches(tests):
+    """Split `tests` into consecutive groups that can be graded in one request."""
+    pairs = [(test["input"], {}) for test in tests]
+    return [[tests[i] for i in batch] for batch in plan_batches(pairs)]
+
+
+async def evaluate_test(function, version, test, timeout=EVALUATION_TEST_TIMEOUT):
+    return (await evaluate_tests(function, version, [test], timeout))[0]
+
+
+async def evaluate_tests(function, version, tests, timeout=EVALUATION_TEST_TIMEOUT, lane="bulk"):
+    calls = []
     for test in tests:
         input_data = test["input"]
         # Here, you would call your function with input_data
         # Since we don't have the actual function implementation, we'll simulate it
         output_data = {}  # Simulated output
-        evaluation_scores = evaluate_output(
+        calls.append(
+            {
+                "call_key": str(uuid.uuid4()),
+                "inputs": input_data,
+                "outputs": output_data,
+                "evaluation": {},
+                "logs": [],
+                "status": "evaluated",
+                "timestamp": datetime.utcnow().isoformat(),
+            }
+        )
+    try:
+        evaluations = await evaluate_outputs(
             function["task"],
             function["version_map"][version].get("metrics", []),
-            input_data,
-            output_data,
+            [(call["inputs"], call["outputs"]) for call in calls],
+            lane,
+            timeout,
+            return_exceptions=True,
         )
-        call = {
-            "call_key": str(uuid.uuid4()),
-            "inputs": input_data,
-            "outputs": output_data,
-            "evaluation": evaluation_scores,
-            "logs": [],
-            "status": "evaluated",
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-        output.append(call)
-    return output
-
-
-def evaluate_output(task, metrics, input, output):
+    except Exception as e:
+        evaluations = [e] * len(calls)
+    for call, evaluation in zip(calls, evaluations):
+        if isinstance(evaluation, BaseException):
+            # Record the failure on this test instead of failing the whole set
+            error = "Evaluation timed out" if isinstance(evaluation, asyncio.TimeoutError) else str(evaluation)
+            print(f"Error evaluating test: {error}")
+            call["status"] = "failed"
+            call["logs"].append({"message": error, "timestamp": call["timestamp"]})
+        else:
+            call["evaluation"] = evaluation
+    return calls
+
+
+async def evaluate_output(task, metrics, input, output):
+    return (await evaluate_outputs(task, metrics, [(input, output)]))[0]
+
+
+async def evaluate_outputs(task, metrics, pairs, lane="interactive", timeout=None, return_exceptions=False):
+    """Grade (input, output) pairs for one task, several per request where they fit.
+
+    Cached evaluations are reused; the rest are graded in batches from
+    plan_batches(). Results keep the order of `pairs`. `timeout` bounds each
+    grading request. With `return_exceptions`, a pair that could not be
+    graded gets its exception in place of an evaluation; otherwise the first
+    such exception is raised.
+    """
+    keys = [evaluation_cache_key(task, metrics, input, output) for input, output in pairs]
+    results = await asyncio.gather(*(_cached_evaluation(key) for key in keys))
+    missing = [i for i, evaluation in enumerate(results) if evaluation is None]
+
+    async def grade(batch):
+        evaluations = await grade_batch(task, metrics, [pairs[i] for i in batch], lane, timeout)
+        for i, evaluation in zip(batch, evaluations):
+            results[i] = evaluation
+            # Failed parses come back empty and are worth retrying
+            if evaluation and not isinstance(evaluation, BaseException):
+                evaluation_cache.set(keys[i], evaluation)
+                await _save_cached_evaluation(keys[i], evaluation)
+
+    await asyncio.gather(
+        *(
+            grade([missing[j] for j in batch])
+            for batch in plan_batches([pairs[i] for i in missing])
+        )
+    )
+    if not return_exceptions:
+        for evaluation in results:
+            if isinstance(evaluation, BaseException):
+                raise evaluation
+    # Callers store and mutate what they get back
+    return [
+        evaluation if isinstance(evaluation, BaseException) else copy.deepcopy(evaluation)
+        for evaluation in results
+    ]
+
+
+def _estimate_tokens(pair):
+    # Roughly four characters per token is close enough to size batches
+    return len(json.dumps(pair, default=_canonical)) // 4 + 1
+
+
+def plan_batches(pairs, max_items=EVALUATION_BATCH_MAX_ITEMS, max_tokens=EVALUATION_BATCH_MAX_TOKENS):
+    """Group consecutive pair indices so each group stays under both limits.
+
+    Small pairs are packed up to `max_items` per request; a pair larger
+    than `max_tokens` on its own is graded alone.
+    """
+    batches, batch, tokens = [], [], 0
+    for i, pair in enumerate(pairs):
+        size = _estimate_tokens(pair)
+        if batch and (len(batch) >= max_items or tokens + size > max_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(i)
+        tokens += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _cached_evaluation(cache_key):
+    evaluation = evaluation_cache.get(cache_key)
+    if evaluation is None:
+        evaluation = await _load_cached_evaluation(cache_key)
+        if evaluation is not None:
+            evaluation_cache.set(cache_key, evaluation)
+    return evaluation
+
+
+async def _load_cached_evaluation(cache_key):
+    if not EVALUATION_CACHE_TABLE:
+        return None
+    try:
+        evaluation = await get_cached_evaluation(cache_key)
+    except Exception as e:
+        print(f"Error reading evaluation cache: {e}")
+        persistent_cache_stats["errors"] += 1
+        return None
+    persistent_cache_stats["hits" if evaluation is not None else "misses"] += 1
+    return evaluation
+
+
+async def _save_cached_evaluation(cache_key, evaluation):
+    if not EVALUATION_CACHE_TABLE:
+        return
+    try:
+        await save_cached_evaluation(cache_key, evaluation, EVALUATION_CACHE_TTL)
+    except Exception as e:
+        print(f"Error writing evaluation cache: {e}")
+        persistent_cache_stats["errors"] += 1
+
+
+async def grade_output(task, metrics, input, output, lane="interactive", timeout=None):
     # Use OpenAI API to evaluate the output based on desired properties
     evaluation_prompt = f"""
     Evaluate the following output based on the desired properties.
@@ -51,7 +231,9 @@ def evaluate_output(task, metrics, input, output):
     """
     print(f"Evaluation prompt: {evaluation_prompt}")
 
-    response = client.chat.completions.create(
+    response = await chat_completion(
+        lane,
+        timeout,
         model=MODEL,
         messages=[
             {"role": "system", "content": eval_prompt},
@@ -76,3 +258,75 @@ def evaluate_output(task, metrics, input, output):
         pass
 
     return evaluation_scores
+
+
+async def grade_batch(task, metrics, pairs, lane="interactive", timeout=None):
+    """Grade several pairs in one request, falling back to one request per pair.
+
+    Items missing from the model's answer, or malformed, are graded
+    individually; so is the whole batch if the request fails or times out,
+    or its answer can't be parsed. A pair that fails on its own gets its
+    exception in place of an evaluation.
+    """
+    if len(pairs) == 1:
+        return await asyncio.gather(grade_output(task, metrics, *pairs[0], lane, timeout), return_exceptions=True)
+
+    items = "\n".join(
+        f"""
+    Item {i}:
+    Input: {input}
+    Output: {output}"""
+        for i, (input, output) in enumerate(pairs)
+    )
+    evaluation_prompt = f"""
+    Evaluate each of the following outputs based on the desired properties.
+    Task: {task}
+    Metrics: {', '.join(metrics)}
+    Provide a score between 0 and 100 for each metric. ONLY provide scores for the metrics provided.
+    Return one evaluation per item, with its item index.
+    {items}
+    """
+
+    evaluations = [None] * len(pairs)
+    try:
+        response = await chat_completion(
+            lane,
+            timeout,
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": eval_prompt},
+                {"role": "user", "content": evaluation_prompt},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "evaluations",
+                    "schema": BatchEvaluationOutput.model_json_schema(),
+                },
+            },
+        )
+        output = json.loads(response.choices[0].message.content)
+        for item in output["evaluations"]:
+            index = item.get("index")
+            if (
+                isinstance(index, int)
+                and 0 <= index < len(pairs)
+                and isinstance(item.get("analysis"), str)
+                and isinstance(item.get("scores"), dict)
+                and all(metric in item["scores"] for metric in metrics)
+            ):
+                evaluations[index] = {"analysis": item["analysis"], "scores": item["scores"]}
+    except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        print(f"Malformed batch evaluation, grading items individually: {e}")
+    except Exception as e:
+        error = "timed out" if isinstance(e, asyncio.TimeoutError) else e
+        print(f"Batch evaluation failed, grading items individually: {error}")
+
+    missing = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+    graded = await asyncio.gather(
+        *(grade_output(task, metrics, *pairs[i], lane, timeout) for i in missing),
+        return_exceptions=True,
+    )
+    for i, evaluation in zip(missing, graded):
+        evaluations[i] = evaluation
+    return evaluations
@@ -1,41 +1,69 @@
 
 from decimal import Decimal
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
 from Prompts import test_generation_prompt
+from openai_client import chat_completion
+from CompiledSchema import compile_schema
+from config import (
+    TEST_GENERATION_CHUNK_SIZE,
+    TEST_GENERATION_CONCURRENCY,
+    TEST_GENERATION_CHUNK_RETRIES,
+)
+import asyncio
+import itertools
 import json
 
-load_dotenv()
-
 MODEL = "gpt-4o-mini"
 
-def generate_tests_from_schema(task, input_schema, num_tests):
-    # def generate_single_test():
-    #     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    #     print('input_schema', input_schema)
-    #     cleaned_schema = convert_input_schema_to_openai_function_definition(input_schema)
-    #     print('cleaned_schema', cleaned_schema)
-    #     response = client.chat.completions.create(
-    #         model=MODEL,
-    #         messages=[
-    #             {"role": "system", "content": test_generation_prompt},
-    #             {"role": "user", "content": f"Task:\n{task}"}
-    #         ],
-    #         response_format={
-    #             "type": "json_schema",
-    #             "json_schema": cleaned_schema
-    #         },
-    #         temperature = 1
-    #     )
-    #     test_input = response.choices[0].message.content
-    #     return json.loads(test_input)
-    
-    # with concurrent.futures.ThreadPoolExecutor() as executor:
-    #     tests = list(executor.map(lambda _: generate_single_test(), range(num_tests)))
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async def generate_tests_from_schema(task, input_schema, num_tests):
+    tests = []
+    async for chunk in stream_tests_from_schema(task, input_schema, num_tests):
+        tests.extend(chunk.get("tests", []))
+    return tests
+
+async def stream_tests_from_schema(
+    task,
+    input_schema,
+    num_tests,
+    chunk_size=TEST_GENERATION_CHUNK_SIZE,
+    concurrency=TEST_GENERATION_CONCURRENCY,
+):
+    """Generate `num_tests` inputs in chunks of `chunk_size`, run concurrently.
+
+    Yields {"tests": [...]} for each chunk as soon as it is generated, in
+    completion order, or {"error": ..., "count": n} for a chunk that still
+    failed after TEST_GENERATION_CHUNK_RETRIES retries.
+    """
+    async def generate(count):
+        for attempt in range(TEST_GENERATION_CHUNK_RETRIES + 1):
+            try:
+                return {"tests": await generate_test_chunk(task, input_schema, count)}
+            except Exception as e:
+                error = str(e)
+                print(f"Error generating tests (attempt {attempt + 1}): {error}")
+        return {"error": error, "count": count}
+
+    # Chunks are started as earlier ones finish, so at most `concurrency`
+    # tasks exist however many tests are asked for
+    sizes = (min(chunk_size, num_tests - start) for start in range(0, num_tests, chunk_size))
+    running = set()
+    try:
+        while True:
+            for size in itertools.islice(sizes, concurrency - len(running)):
+                running.add(asyncio.create_task(generate(size)))
+            if not running:
+                return
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for chunk in done:
+                yield chunk.result()
+    finally:
+        # The caller stopped reading, e.g. a client disconnected mid-stream
+        for chunk in running:
+            chunk.cancel()
+
+async def generate_test_chunk(task, input_schema, num_tests):
     cleaned_schema = convert_input_schema_to_openai_function_definition(input_schema, num_tests)
-    response = client.chat.completions.create(
+    response = await chat_completion(
+        "bulk",
         model=MODEL,
         messages=[
             {"role": "system", "content": test_generation_prompt},
@@ -49,28 +77,17 @@ def generate_tests_from_schema(task, input_schema, num_tests):
     )
     tests = json.loads(response.choices[0].message.content)
     tests = [tests[f"test_{i}"] for i in range(num_tests)]
+    # A chunk with an invalid test fails as a whole and is retried
+    compiled = compile_schema(input_schema)
+    for test in tests:
+        errors = compiled.validate(test)
+        if errors:
+            raise ValueError("Generated test does not match the input schema: " + "; ".join(errors))
     return tests
 
 def convert_input_schema_to_openai_function_definition(input_schema, num_tests=1):
     new_schema = {}
-    def clean_schema(schema):
-        if isinstance(schema, dict):
-            schema = schema.copy()
-            if "title" in schema:
-                schema.pop("title", None)
-            if 'desiredProperties' in schema:
-                schema.pop('desiredProperties', None)
-            if 'properties' in schema:
-                schema['properties'] = {k: clean_schema(v) for k, v in schema['properties'].items()}
-            if 'items' in schema:
-                schema['items'] = clean_schema(schema['items'])
-            if 'required' not in schema and 'properties' in schema:
-                schema['required'] = list(schema['properties'].keys())
-            schema['additionalProperties'] = False
-        return schema
-    
-    cleaned_schema = clean_schema(input_schema)
-    print(cleaned_schema)
+    cleaned_schema = compile_schema(input_schema).cleaned
     new_schema['schema'] = {
         "type": "object",
         "properties": {f"test_{i}": cleaned_schema for i in range(num_tests)},
@@ -0,0 +1,211 @@
+# api/VersionComparison.py
+#
+# Statistics for deciding whether one version's scores differ from
+# another's. Each version's calls are loaded once into NumPy columns, one
+# per metric, with NaN where a call has no score for that metric. The
+# comparisons below then run on the whole columns:
+#
+#   - an unpaired comparison of the mean scores, with a bootstrap
+#     confidence interval for the difference, and
+#   - a paired comparison over inputs both versions were called with
+#     (e.g. the same test set graded against each), where every input
+#     contributes one difference between its mean scores.
+#
+# "overall" is added as a metric: the mean of each call's metric scores.
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import orjson
+
+from rollups import SCORE_TYPES
+
+OVERALL = "overall"
+
+# Bootstrap means are drawn from a multinomial over the distinct values,
+# which costs the same however many calls there are. Grades are integers,
+# so there are few; past this many, values are binned into this many
+# evenly spaced levels instead.
+BOOTSTRAP_MAX_VALUES = 512
+
+
+class ScoreColumns:
+    """One version's scores: `inputs[i]` identifies the inputs of call i and
+    `scores[metric][i]` is its score, NaN if it has none."""
+
+    def __init__(self, inputs: np.ndarray, scores: Dict[str, np.ndarray]):
+        self.inputs = inputs
+        self.scores = scores
+
+
+def _input_key(inputs: Any) -> bytes:
+    return orjson.dumps(inputs, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+
+def score_columns(calls: List[Dict[str, Any]], input_ids: Dict[bytes, int]) -> ScoreColumns:
+    # `input_ids` is shared between the versions being compared, so equal
+    # inputs get the same id in each
+    n = len(calls)
+    inputs = np.fromiter(
+        (input_ids.setdefault(_input_key(call.get("inputs")), len(input_ids)) for call in calls),
+        dtype=np.int64,
+        count=n,
+    )
+    # Gather (call index, score) pairs per metric, then fill each column at once
+    positions: Dict[str, List[int]] = {}
+    values: Dict[str, List[float]] = {}
+    for i, call in enumerate(calls):
+        evaluation = call.get("evaluation")
+        if not evaluation:
+            continue
+        for metric, score in (evaluation.get("scores") or {}).items():
+            if not isinstance(score, SCORE_TYPES) or isinstance(score, bool):
+                continue
+            if metric not in positions:
+                positions[metric] = []
+                values[metric] = []
+            positions[metric].append(i)
+            values[metric].append(float(score))
+    scores: Dict[str, np.ndarray] = {}
+    for metric in positions:
+        column = scores[metric] = np.full(n, np.nan)
+        column[positions[metric]] = values[metric]
+    if scores:
+        stacked = np.vstack(list(scores.values()))
+        present = ~np.isnan(stacked)
+        counts = present.sum(axis=0)
+        totals = np.where(present, stacked, 0.0).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores[OVERALL] = np.where(counts > 0, totals / counts, np.nan)
+    return ScoreColumns(inputs, scores)
+
+
+def bootstrap_means(values: np.ndarray, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """Means of `resamples` bootstrap resamples of `values`."""
+    n = len(values)
+    # Rounded so differences of averaged scores that are equal compare equal
+    distinct, counts = np.unique(np.round(values, 9), return_counts=True)
+    if len(distinct) > BOOTSTRAP_MAX_VALUES:
+        counts, edges = np.histogram(values, bins=BOOTSTRAP_MAX_VALUES)
+        distinct = (edges[:-1] + edges[1:]) / 2
+    draws = rng.multinomial(n, counts / n, size=resamples)
+    # Centre on the exact mean; rounding and binning only shape the spread
+    return draws @ distinct / n + (values.mean() - counts @ distinct / n)
+
+
+def _interval(deltas: np.ndarray, confidence: float) -> Dict[str, Any]:
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(deltas, [tail, 100 - tail])
+    # Two-sided: how often the resampled difference lands on the far side of 0
+    p_value = min(1.0, 2 * min(np.mean(deltas <= 0), np.mean(deltas >= 0)))
+    return {
+        "ci": [float(low), float(high)],
+        "p_value": float(p_value),
+        "distinguishable": bool(low > 0 or high < 0),
+    }
+
+
+def _input_means(inputs: np.ndarray, values: np.ndarray):
+    # Mean score per distinct input, for inputs that were called more than once
+    present = ~np.isnan(values)
+    ids, inverse = np.unique(inputs[present], return_inverse=True)
+    sums = np.bincount(inverse, weights=values[present], minlength=len(ids))
+    counts = np.bincount(inverse, minlength=len(ids))
+    return ids, sums / counts
+
+
+def compare_unpaired(
+    baseline: np.ndarray,
+    candidate: np.ndarray,
+    resamples: int,
+    confidence: float,
+    rng: np.random.Generator,
+) -> Optional[Dict[str, Any]]:
+    baseline = baseline[~np.isnan(baseline)]
+    candidate = candidate[~np.isnan(candidate)]
+    if len(baseline) == 0 or len(candidate) == 0:
+        return None
+    deltas = bootstrap_means(candidate, resamples, rng) - bootstrap_means(baseline, resamples, rng)
+    return {
+        "count": [len(baseline), len(candidate)],
+        "mean": [float(baseline.mean()), float(candidate.mean())],
+        "delta": float(candidate.mean() - baseline.mean()),
+        **_interval(deltas, confidence),
+    }
+
+
+def compare_paired(
+    baseline: ScoreColumns,
+    candidate: ScoreColumns,
+    metric: str,
+    resamples: int,
+    confidence: float,
+    rng: np.random.Generator,
+) -> Optional[Dict[str, Any]]:
+    baseline_ids, baseline_means = _input_means(baseline.inputs, baseline.scores[metric])
+    candidate_ids, candidate_means = _input_means(candidate.inputs, candidate.scores[metric])
+    _, in_baseline, in_candidate = np.intersect1d(
+        baseline_ids, candidate_ids, assume_unique=True, return_indices=True
+    )
+    if len(in_baseline) < 2:
+        return None
+    differences = candidate_means[in_candidate] - baseline_means[in_baseline]
+    return {
+        "inputs": len(differences),
+        "delta": float(differences.mean()),
+        "wins": int(np.sum(differences > 0)),
+        "losses": int(np.sum(differences < 0)),
+        "ties": int(np.sum(differences == 0)),
+        **_interval(bootstrap_means(differences, resamples, rng), confidence),
+    }
+
+
+def compare_versions(
+    calls: Dict[str, List[Dict[str, Any]]],
+    baseline: str,
+    resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Compare each version in `calls` against `baseline`, metric by metric.
+
+    `calls` maps a version to its calls, as stored or as returned by
+    evaluate_tests(). A metric is `distinguishable` when the confidence
+    interval of its paired difference excludes zero, or of its unpaired
+    difference if the versions share fewer than two inputs. A version is
+    distinguishable when its "overall" metric is.
+    """
+    # Seeded so the same calls always give the same intervals
+    rng = np.random.default_rng(seed)
+    input_ids: Dict[bytes, int] = {}
+    columns = {version: score_columns(version_calls, input_ids) for version, version_calls in calls.items()}
+    base = columns[baseline]
+    comparisons = {}
+    for version, candidate in columns.items():
+        if version == baseline:
+            continue
+        metrics = {}
+        for metric in sorted(set(base.scores) & set(candidate.scores)):
+            unpaired = compare_unpaired(
+                base.scores[metric], candidate.scores[metric], resamples, confidence, rng
+            )
+            if unpaired is None:
+                continue
+            paired = compare_paired(base, candidate, metric, resamples, confidence, rng)
+            metrics[metric] = {
+                **unpaired,
+                "paired": paired,
+                "distinguishable": (paired or unpaired)["distinguishable"],
+            }
+        comparisons[version] = {
+            "calls": len(calls[version]),
+            "metrics": metrics,
+            "distinguishable": metrics.get(OVERALL, {}).get("distinguishable", False),
+        }
+    return {
+        "baseline": baseline,
+        "calls": len(calls[baseline]),
+        "confidence": confidence,
+        "resamples": resamples,
+        "versions": comparisons,
+    }
@@ -0,0 +1,104 @@
+# api/VersionTree.py
+#
+# Functions store their version lineage as a flat index,
+#   version_index = {version_id: {"parent": parent_id | None, "children": [ids]}}
+# plus root_version. The nested {"name", "children"} tree used by the
+# dashboard is derived from it on read. Everything here is iterative so
+# long lineages don't hit Python's recursion limit.
+
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def index_version_tree(tree: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # Build the flat index from a legacy nested version_tree
+    index = {tree["name"]: {"parent": None, "children": []}}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for child in node.get("children", []):
+            index[node["name"]]["children"].append(child["name"])
+            index[child["name"]] = {"parent": node["name"], "children": []}
+            stack.append(child)
+    return index
+
+
+def get_version_index(function: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, Any]], str]:
+    """Return (version_index, root_version), deriving them for legacy functions."""
+    if "version_index" in function:
+        return function["version_index"], function["root_version"]
+    tree = function["version_tree"]
+    return index_version_tree(tree), tree["name"]
+
+
+def build_version_tree(index: Dict[str, Dict[str, Any]], root: str) -> Dict[str, Any]:
+    tree = {"name": root, "children": []}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for child_name in index[node["name"]]["children"]:
+            child = {"name": child_name, "children": []}
+            node["children"].append(child)
+            stack.append(child)
+    return tree
+
+
+def with_version_tree(function: Dict[str, Any]) -> Dict[str, Any]:
+    # Fill in the nested tree for clients that read version_tree
+    if "version_index" in function and "root_version" in function:
+        function["version_tree"] = build_version_tree(
+            function["version_index"], function["root_version"]
+        )
+    return function
+
+
+def version_ancestors(index: Dict[str, Dict[str, Any]], version: str) -> List[str]:
+    """Versions from `version`'s parent up to the root."""
+    ancestors = []
+    parent = index[version]["parent"]
+    while parent is not None:
+        ancestors.append(parent)
+        parent = index[parent]["parent"]
+    return ancestors
+
+
+def version_descendants(index: Dict[str, Dict[str, Any]], version: str) -> List[str]:
+    """All versions below `version`, breadth first."""
+    descendants = []
+    frontier = list(index[version]["children"])
+    while frontier:
+        descendants.extend(frontier)
+        frontier = [child for name in frontier for child in index[name]["children"]]
+    return descendants
+
+
+def new_root_updates(version: str) -> Dict[str, Any]:
+    # Attributes for a function whose only version is `version`
+    return {
+        "version_index": {version: {"parent": None, "children": []}},
+        "root_version": version,
+    }
+
+
+def add_version_updates(function: Dict[str, Any], parent: str, version: str) -> Optional[Dict[str, Any]]:
+    """Return update_function keyword arguments that add `version` under `parent`.
+
+    Indexed functions get two targeted writes. Legacy functions have their
+    index written in full once, replacing version_tree, and only if no
+    other writer created the index first; reload and retry if that write
+    is rejected. Returns None if `parent` doesn't exist.
+    """
+    index, root = get_version_index(function)
+    if parent not in index:
+        return None
+    if "version_index" in function:
+        return {
+            "updates": {("version_index", version): {"parent": parent, "children": []}},
+            "appends": {("version_index", parent, "children"): [version]},
+        }
+    index[parent]["children"].append(version)
+    index[version] = {"parent": parent, "children": []}
+    return {
+        "updates": {("version_index",): index, ("root_version",): root},
+        "must_not_exist": [("version_index",)],
+        "removes": [("version_tree",)],
+    }
@@ -0,0 +1,226 @@
+# api/archive.py
+#
+# Cold storage for calls. compaction.py moves calls older than
+# CALL_RETENTION_DAYS out of the calls table into append-only segment
+# files, one directory per function version:
+#
+#   CALL_ARCHIVE_DIR/<function_key>#<version>/000001.jsonl.zst
+#   CALL_ARCHIVE_DIR/<function_key>#<version>/000001.index.json
+#
+# A segment holds calls as JSON lines, oldest first, compressed in
+# independent blocks (zstd if zstandard is installed, gzip otherwise). Its
+# sidecar index records each block's offset, length and call_sort_key
+# range, and the block holding each call_key, so a page of calls only
+# decompresses the blocks it needs. Segments are memory-mapped to read
+# them. They are never modified once written; the index is written last,
+# and a segment without one is ignored.
+
+import gzip
+import heapq
+import json
+import mmap
+import os
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+import orjson
+
+from cache import LRUCache
+from config import CALL_ARCHIVE_DIR, CALL_ARCHIVE_BLOCK_CALLS, GZIP_LEVEL, ZSTD_LEVEL
+
+# Optional: zstd-compressed segments when zstandard is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INDEX_SUFFIX = ".index.json"
+CODEC_SUFFIXES = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+
+# Segments are immutable, so their indexes can be kept indefinitely
+segment_index_cache = LRUCache(1024)
+
+
+def _default(obj: Any) -> Any:
+    # Calls read from DynamoDB carry Decimals
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _sort_key(call: Dict[str, Any]) -> str:
+    return f"{call['timestamp']}#{call['call_key']}"
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd call archives")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def partition_dir(function_key: str, version: str) -> str:
+    return os.path.join(CALL_ARCHIVE_DIR, quote(f"{function_key}#{version}", safe=""))
+
+
+class Segment:
+    def __init__(self, path: str, index: Dict[str, Any]):
+        self.path = path
+        self.codec = index["codec"]
+        # [{"offset", "length", "count", "first", "last"}], oldest first
+        self.blocks = index["blocks"]
+        # call_key -> block number
+        self.calls = index["calls"]
+
+    def read_block(self, data: mmap.mmap, block: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raw = _decompress(data[block["offset"]:block["offset"] + block["length"]], self.codec)
+        return [orjson.loads(line) for line in raw.splitlines()]
+
+
+def _load_index(index_path: str) -> Dict[str, Any]:
+    index = segment_index_cache.get(index_path)
+    if index is None:
+        with open(index_path, "rb") as f:
+            index = orjson.loads(f.read())
+        segment_index_cache.set(index_path, index)
+    return index
+
+
+def load_segments(function_key: str, version: str) -> List[Segment]:
+    """Complete segments for a version, oldest first."""
+    directory = partition_dir(function_key, version)
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    segments = []
+    for name in names:
+        if not name.endswith(INDEX_SUFFIX):
+            continue
+        index = _load_index(os.path.join(directory, name))
+        data_name = name[: -len(INDEX_SUFFIX)] + CODEC_SUFFIXES[index["codec"]]
+        segments.append(Segment(os.path.join(directory, data_name), index))
+    return segments
+
+
+def archived_call_keys(function_key: str, version: str) -> Set[str]:
+    return {call_key for segment in load_segments(function_key, version) for call_key in segment.calls}
+
+
+def archived_call_count(function_key: str, version: str) -> int:
+    # From the indexes alone; no segment is read
+    return sum(len(segment.calls) for segment in load_segments(function_key, version))
+
+
+def _next_sequence(directory: str) -> int:
+    numbers = [int(name.split(".")[0]) for name in os.listdir(directory) if name.split(".")[0].isdigit()]
+    return max(numbers, default=0) + 1
+
+
+def _write_file(path: str, data: bytes):
+    # Write then rename, so readers never see a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_segment(function_key: str, version: str, calls: List[Dict[str, Any]]) -> str:
+    """Archive `calls` of one version as a new segment and return its path."""
+    codec = "zstd" if zstandard is not None else "gzip"
+    directory = partition_dir(function_key, version)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{_next_sequence(directory):06d}")
+
+    calls = sorted(calls, key=_sort_key)
+    blocks = []
+    call_blocks = {}
+    chunks = []
+    offset = 0
+    for start in range(0, len(calls), CALL_ARCHIVE_BLOCK_CALLS):
+        block_calls = calls[start:start + CALL_ARCHIVE_BLOCK_CALLS]
+        raw = b"\n".join(orjson.dumps(call, default=_default) for call in block_calls)
+        chunk = _compress(raw, codec)
+        blocks.append(
+            {
+                "offset": offset,
+                "length": len(chunk),
+                "count": len(block_calls),
+                "first": _sort_key(block_calls[0]),
+                "last": _sort_key(block_calls[-1]),
+            }
+        )
+        for call in block_calls:
+            call_blocks[call["call_key"]] = len(blocks) - 1
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    _write_file(base + CODEC_SUFFIXES[codec], b"".join(chunks))
+    index = {"codec": codec, "blocks": blocks, "calls": call_blocks}
+    _write_file(base + INDEX_SUFFIX, json.dumps(index).encode())
+    return base + CODEC_SUFFIXES[codec]
+
+
+def archive_new_calls(function_key: str, version: str, calls: List[Dict[str, Any]]) -> int:
+    """Write the calls not already archived as a new segment; return how many."""
+    archived = archived_call_keys(function_key, version)
+    calls = [call for call in calls if call["call_key"] not in archived]
+    if calls:
+        write_segment(function_key, version, calls)
+    return len(calls)
+
+
+def _iter_segment(segment: Segment, before: Optional[str]) -> Iterator[Dict[str, Any]]:
+    blocks = [b for b in segment.blocks if before is None or b["first"] < before]
+    if not blocks:
+        return
+    with open(segment.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for block in reversed(blocks):
+            for call in reversed(segment.read_block(data, block)):
+                if before is None or _sort_key(call) < before:
+                    yield call
+
+
+def iter_archived_calls(
+    function_key: str,
+    version: str,
+    before: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Archived calls of a version, newest first.
+
+    `before` is a call_sort_key; only calls that sort before it are read.
+    """
+    # Segments usually cover successive time ranges, but merge in case a
+    # later compaction archived older calls
+    segments = [_iter_segment(segment, before) for segment in load_segments(function_key, version)]
+    for call in heapq.merge(*segments, key=_sort_key, reverse=True):
+        if statuses and call.get("status") not in statuses:
+            continue
+        yield call
+
+
+def read_archived_calls(
+    function_key: str,
+    version: str,
+    limit: int,
+    before: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Up to `limit` archived calls, newest first, and whether more remain."""
+    calls = []
+    for call in iter_archived_calls(function_key, version, before, statuses):
+        if len(calls) >= limit:
+            return calls, True
+        calls.append(call)
+    return calls, False
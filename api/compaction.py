@@ -0,0 +1,75 @@
+# api/compaction.py
+#
+# Moves calls older than CALL_RETENTION_DAYS from the calls table into
+# archive segments (see archive.py). Safe to re-run: calls already in a
+# segment are only deleted from the table. Run from the api directory,
+# e.g. daily from cron:
+#   python compaction.py [retention_days]
+
+import sys
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from boto3.dynamodb.conditions import Attr
+
+import utils
+from archive import archive_new_calls
+from config import CALL_RETENTION_DAYS, CALL_ARCHIVE_SEGMENT_CALLS
+
+
+async def scan_cold_calls(cutoff: str):
+    kwargs = {"FilterExpression": Attr("timestamp").lt(cutoff)}
+    response = await utils.calls_table.scan(**kwargs)
+    for item in response.get("Items", []):
+        yield item
+    while "LastEvaluatedKey" in response:
+        response = await utils.calls_table.scan(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        for item in response.get("Items", []):
+            yield item
+
+
+async def archive_calls(items: List[Dict[str, Any]]) -> int:
+    """Archive one version's cold call items, then delete them from the table."""
+    function_key, version = items[0]["function_key"], items[0]["version"]
+    calls = [
+        {k: v for k, v in item.items() if k not in ("function_version", "call_sort_key")}
+        for item in items
+    ]
+    count = await asyncio.to_thread(archive_new_calls, function_key, version, calls)
+    # Only once the segment is on disk
+    async with utils.calls_table.batch_writer() as batch:
+        for item in items:
+            await batch.delete_item(
+                Key={"function_version": item["function_version"], "call_sort_key": item["call_sort_key"]}
+            )
+    return count
+
+
+async def compact_calls(retention_days: float = CALL_RETENTION_DAYS):
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+    pending: Dict[str, List[Dict[str, Any]]] = {}
+    count = 0
+    async for item in scan_cold_calls(cutoff):
+        partition = item["function_version"]
+        pending.setdefault(partition, []).append(item)
+        if len(pending[partition]) >= CALL_ARCHIVE_SEGMENT_CALLS:
+            count += await archive_calls(pending.pop(partition))
+    for items in pending.values():
+        count += await archive_calls(items)
+    print(f"Archived {count} calls older than {cutoff}")
+
+
+async def run(retention_days: float):
+    await utils.connect_dynamodb()
+    try:
+        await compact_calls(retention_days)
+    finally:
+        await utils.close_dynamodb()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python compaction.py [retention_days]")
+        sys.exit(1)
+    asyncio.run(run(float(sys.argv[1]) if len(sys.argv) == 2 else CALL_RETENTION_DAYS))
@@ -17,3 +17,105 @@ PORT = int(os.getenv("PORT", 8000))
 
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+
+# Max number of api_key -> username entries held in memory
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", 10000))
+
+# In-process cache of function items served to the SDK; set
+# FUNCTION_CACHE_ENABLED=false to always read from DynamoDB
+FUNCTION_CACHE_ENABLED = os.getenv("FUNCTION_CACHE_ENABLED", "true").lower() == "true"
+FUNCTION_CACHE_SIZE = int(os.getenv("FUNCTION_CACHE_SIZE", 2000))
+FUNCTION_CACHE_TTL = float(os.getenv("FUNCTION_CACHE_TTL", 30))
+
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+
+# DynamoDB client connection pool and timeouts (seconds)
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", 50))
+DYNAMODB_CONNECT_TIMEOUT = float(os.getenv("DYNAMODB_CONNECT_TIMEOUT", 2))
+DYNAMODB_READ_TIMEOUT = float(os.getenv("DYNAMODB_READ_TIMEOUT", 5))
+DYNAMODB_MAX_RETRIES = int(os.getenv("DYNAMODB_MAX_RETRIES", 3))
+
+# OpenAI client connection pool and timeouts (seconds)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 5))
+
+# Outbound OpenAI rate limiting: concurrency starts at the initial value and
+# adapts up to the max from rate-limit headers and 429s. Retries back off
+# exponentially with jitter from the base up to the cap (seconds).
+OPENAI_INITIAL_CONCURRENCY = int(os.getenv("OPENAI_INITIAL_CONCURRENCY", 8))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", OPENAI_MAX_CONNECTIONS))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", 0.5))
+OPENAI_BACKOFF_CAP = float(os.getenv("OPENAI_BACKOFF_CAP", 30))
+
+# Function change notifications pushed to SDK clients (seconds)
+FUNCTION_EVENTS_POLL_INTERVAL = float(os.getenv("FUNCTION_EVENTS_POLL_INTERVAL", 1))
+FUNCTION_EVENTS_KEEPALIVE = float(os.getenv("FUNCTION_EVENTS_KEEPALIVE", 15))
+
+# Bulk call ingestion: records per storage batch, batches written concurrently
+# and the largest accepted NDJSON line in bytes
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 25))
+BULK_WRITE_CONCURRENCY = int(os.getenv("BULK_WRITE_CONCURRENCY", 4))
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", 1024 * 1024))
+
+# Response compression for large payloads (gzip, or zstd if zstandard is installed)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+# Background evaluation jobs: concurrent grading workers and how many
+# finished jobs are kept for status polling
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", 8))
+EVALUATION_JOB_RETENTION = int(os.getenv("EVALUATION_JOB_RETENTION", 10000))
+
+# Grading requests in flight per test set (each holds one of the
+# EVALUATION_WORKERS), and seconds a grading request may take once the
+# OpenAI limiter admits it. A batch that overruns is graded item by item,
+# and a test whose own request overruns is recorded as failed.
+EVALUATION_CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", 10))
+EVALUATION_TEST_TIMEOUT = float(os.getenv("EVALUATION_TEST_TIMEOUT", 30))
+
+# Evaluation results cached by a hash of what was graded. Set
+# EVALUATION_CACHE_TABLE to a DynamoDB table name to also share results
+# across workers and restarts.
+EVALUATION_CACHE_SIZE = int(os.getenv("EVALUATION_CACHE_SIZE", 10000))
+EVALUATION_CACHE_TTL = float(os.getenv("EVALUATION_CACHE_TTL", 7 * 24 * 3600))
+EVALUATION_CACHE_TABLE = os.getenv("EVALUATION_CACHE_TABLE")
+
+# Pairs graded per evaluator request, capped by an estimate of their
+# prompt tokens. EVALUATION_BATCH_MAX_ITEMS=1 grades one pair per request.
+EVALUATION_BATCH_MAX_ITEMS = int(os.getenv("EVALUATION_BATCH_MAX_ITEMS", 8))
+EVALUATION_BATCH_MAX_TOKENS = int(os.getenv("EVALUATION_BATCH_MAX_TOKENS", 6000))
+
+# Prometheus-style metrics served at /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Scrapers send it as "Authorization: Bearer <token>"; unset leaves /metrics open
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Test generation: tests per OpenAI request, requests in flight per
+# generation and retries for a failed chunk
+TEST_GENERATION_CHUNK_SIZE = int(os.getenv("TEST_GENERATION_CHUNK_SIZE", 5))
+TEST_GENERATION_CONCURRENCY = int(os.getenv("TEST_GENERATION_CONCURRENCY", 4))
+TEST_GENERATION_CHUNK_RETRIES = int(os.getenv("TEST_GENERATION_CHUNK_RETRIES", 2))
+# Most tests one generation request may ask for, whatever the tier allows
+TEST_GENERATION_MAX_TESTS = int(os.getenv("TEST_GENERATION_MAX_TESTS", 1000))
+
+# Attempts at writing a new version before update_parameters gives up with
+# a 409; a write is retried when a concurrent update changed the function
+VERSION_WRITE_ATTEMPTS = int(os.getenv("VERSION_WRITE_ATTEMPTS", 3))
+
+# Compiled input/output schemas (cleaned OpenAI schema and validators)
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", 512))
+
+# Calls older than CALL_RETENTION_DAYS are moved out of DynamoDB into
+# compressed segment files under CALL_ARCHIVE_DIR by `python compaction.py`.
+# Every API worker must see the same directory.
+CALL_RETENTION_DAYS = float(os.getenv("CALL_RETENTION_DAYS", 90))
+CALL_ARCHIVE_DIR = os.getenv("CALL_ARCHIVE_DIR", "call_archive")
+# Calls per compressed block (the unit a read decompresses) and per segment
+CALL_ARCHIVE_BLOCK_CALLS = int(os.getenv("CALL_ARCHIVE_BLOCK_CALLS", 256))
+CALL_ARCHIVE_SEGMENT_CALLS = int(os.getenv("CALL_ARCHIVE_SEGMENT_CALLS", 10000))
+
+# Calls per chunk written by the streaming export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
@@ -0,0 +1,153 @@
+# api/export.py
+#
+# Streaming call exports as NDJSON, CSV or an Arrow IPC stream. Calls are
+# read a page at a time (utils.iter_calls) and written out in batches, so
+# server memory stays flat however many calls are exported. In CSV and
+# Arrow, nested fields (inputs, outputs, evaluation, logs) are JSON text.
+
+import csv
+import io
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from config import EXPORT_BATCH_SIZE
+from utils import iter_calls
+
+# Optional: Arrow exports when pyarrow is installed
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ("function_key", "version", "call_key", "timestamp", "status", "inputs", "outputs", "evaluation", "logs")
+NESTED_COLUMNS = ("inputs", "outputs", "evaluation", "logs")
+
+# format -> (media type, file extension)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def _default(obj: Any) -> Any:
+    # DynamoDB returns every number as Decimal
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _row(call: Dict[str, Any]) -> List[Optional[str]]:
+    row = []
+    for column in COLUMNS:
+        value = call.get(column)
+        if column in NESTED_COLUMNS and value is not None:
+            value = orjson.dumps(value, default=_default).decode()
+        row.append(value)
+    return row
+
+
+def _timestamp(name: str, value: Optional[str]) -> Optional[str]:
+    # Stored timestamps are naive UTC isoformat strings and compared as text,
+    # so parse the bound and write it the same way
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+async def _batches(
+    function_key: str,
+    versions: List[str],
+    statuses: Optional[List[str]],
+    since: Optional[str],
+    until: Optional[str],
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    batch = []
+    for version in versions:
+        async for call in iter_calls(function_key, version, statuses, since, until):
+            batch.append(call)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def _ndjson(batches: AsyncIterator[List[Dict[str, Any]]]):
+    async for batch in batches:
+        yield b"".join(orjson.dumps(call, default=_default) + b"\n" for call in batch)
+
+
+async def _csv(batches: AsyncIterator[List[Dict[str, Any]]]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for batch in batches:
+        writer.writerows(_row(call) for call in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Just the header if nothing matched
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+async def _arrow(batches: AsyncIterator[List[Dict[str, Any]]]):
+    schema = pyarrow.schema([(column, pyarrow.string()) for column in COLUMNS])
+    sink = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    async for batch in batches:
+        rows = [_row(call) for call in batch]
+        columns = [pyarrow.array([row[i] for row in rows], pyarrow.string()) for i in range(len(COLUMNS))]
+        writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+        yield _drain(sink)
+    # End-of-stream marker
+    writer.close()
+    yield _drain(sink)
+
+
+def export_calls_response(
+    function_key: str,
+    versions: List[str],
+    format: str = "ndjson",
+    statuses: Optional[List[str]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> StreamingResponse:
+    """Stream the calls of `versions`, each newest first, in `format`."""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    if format == "arrow" and pyarrow is None:
+        raise HTTPException(status_code=400, detail="Arrow exports are not available on this server")
+    since, until = _timestamp("since", since), _timestamp("until", until)
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    encoders = {"ndjson": _ndjson, "csv": _csv, "arrow": _arrow}
+    media_type, extension = FORMATS[format]
+    return StreamingResponse(
+        encoders[format](_batches(function_key, versions, statuses, since, until)),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{function_key}.{extension}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
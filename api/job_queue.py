@@ -0,0 +1,217 @@
+# api/job_queue.py
+
+import asyncio
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+Step = Callable[[], Awaitable[Any]]
+Finish = Callable[[List[Any]], Awaitable[Any]]
+OnFailure = Callable[[str], Awaitable[Any]]
+
+
+class Job:
+    def __init__(
+        self,
+        username: str,
+        kind: str,
+        steps: List[Step],
+        finish: Optional[Finish],
+        max_concurrency: Optional[int] = None,
+        on_failure: Optional[OnFailure] = None,
+    ):
+        self.job_id = uuid.uuid4().hex
+        self.username = username
+        self.kind = kind
+        self.steps = steps
+        self.finish = finish
+        self.on_failure = on_failure
+        self.results: List[Any] = [None] * len(steps)
+        self.total = len(steps)
+        self.remaining = len(steps)
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": {"done": self.total - self.remaining, "total": self.total},
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """In-process background job queue, shared fairly between tenants.
+
+    A job is a list of steps (e.g. one grading request per batch of tests)
+    plus an optional `finish` coroutine run on the step results in order.
+    A job may cap how many of its steps run at once (`max_concurrency`)
+    and pass `on_failure`, awaited with the error if a step or `finish`
+    fails, or if the queue is stopped first.
+    Steps wait in a per-tenant queue and `concurrency` workers take them round-robin
+    across tenants, so one large test set is interleaved with everyone
+    else's work instead of running ahead of it. The last `retention`
+    finished jobs are kept for status polling.
+    """
+
+    def __init__(self, concurrency: int, retention: int):
+        self.concurrency = concurrency
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._finished: Deque[str] = deque()
+        self._tenants: "OrderedDict[str, Deque[Tuple[Job, int]]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Stop the workers and fail every job that hasn't finished.
+
+        Jobs live only in this process, so they would otherwise be lost
+        without their on_failure being run (e.g. calls left "evaluating").
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._tenants.clear()
+        for job in list(self._jobs.values()):
+            if job.status in ("queued", "running"):
+                await self._fail(job, "Server shut down before the job finished")
+
+    def submit(
+        self,
+        username: str,
+        kind: str,
+        steps: List[Step],
+        finish: Optional[Finish] = None,
+        max_concurrency: Optional[int] = None,
+        on_failure: Optional[OnFailure] = None,
+    ) -> Job:
+        job = Job(username, kind, steps or [_no_step], finish, max_concurrency, on_failure)
+        self._jobs[job.job_id] = job
+        pending = self._tenants.setdefault(username, deque())
+        pending.extend((job, index) for index in range(len(job.steps)))
+        self._ready.set()
+        return job
+
+    def get(self, job_id: str, username: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        # Jobs are only visible to the tenant that submitted them
+        return job if job is not None and job.username == username else None
+
+    def list(self, username: str) -> List[Job]:
+        return [job for job in self._jobs.values() if job.username == username]
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": len(self._workers),
+            "queued_steps": sum(len(pending) for pending in self._tenants.values()),
+            "tenants_waiting": len(self._tenants),
+            "jobs": statuses,
+        }
+
+    def _next(self) -> Optional[Tuple[Job, int]]:
+        # Take one step from the tenant that has waited longest, then move
+        # that tenant to the back of the line. A tenant whose next job
+        # already has max_concurrency steps running is passed over.
+        for username in list(self._tenants):
+            pending = self._tenants[username]
+            while pending and pending[0][0].status == "failed":
+                pending.popleft()
+            if not pending:
+                del self._tenants[username]
+                continue
+            job, index = pending[0]
+            if job.max_concurrency and job.running >= job.max_concurrency:
+                continue
+            pending.popleft()
+            if pending:
+                self._tenants.move_to_end(username)
+            else:
+                del self._tenants[username]
+            job.running += 1
+            return job, index
+        return None
+
+    async def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            job, index = item
+            if job.status == "queued":
+                job.status = "running"
+                job.started_at = datetime.utcnow().isoformat()
+            try:
+                result = await job.steps[index]()
+            except Exception as e:
+                if job.status != "failed":
+                    print(f"Error running job {job.job_id}: {e}")
+                    await self._fail(job, str(e))
+                continue
+            finally:
+                # A capped job may now have room for another step
+                job.running -= 1
+                self._ready.set()
+            if job.status == "failed":
+                # Another step of this job already failed it
+                continue
+            job.results[index] = result
+            job.remaining -= 1
+            if job.remaining == 0:
+                await self._complete(job)
+
+    async def _complete(self, job: Job):
+        try:
+            result = await job.finish(job.results) if job.finish else job.results
+        except Exception as e:
+            print(f"Error finishing job {job.job_id}: {e}")
+            await self._fail(job, str(e))
+            return
+        self._done(job, "succeeded", result=result)
+
+    async def _fail(self, job: Job, error: str):
+        on_failure = job.on_failure
+        self._done(job, "failed", error=error)
+        if on_failure is not None:
+            try:
+                await on_failure(error)
+            except Exception as e:
+                print(f"Error recording failure of job {job.job_id}: {e}")
+
+    def _done(self, job: Job, status: str, result: Any = None, error: Optional[str] = None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow().isoformat()
+        # Drop the step closures, they hold the function and test set
+        job.steps, job.finish, job.on_failure, job.results = [], None, None, []
+        self._finished.append(job.job_id)
+        while len(self._finished) > self.retention:
+            self._jobs.pop(self._finished.popleft(), None)
+
+
+async def _no_step():
+    return None
@@ -0,0 +1,82 @@
+# api/jobs.py
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+from config import EVALUATION_WORKERS, EVALUATION_JOB_RETENTION, EVALUATION_CONCURRENCY
+from Evaluation import evaluate_tests, evaluate_output, test_batches
+from utils import put_calls, update_call_fields, call_partition_key, call_sort_key, add_score_rollups
+from rollups import score_deltas
+from job_queue import Job, JobQueue
+
+evaluation_jobs = JobQueue(EVALUATION_WORKERS, EVALUATION_JOB_RETENTION)
+
+
+async def record_scores(function_key, version, added, removed=()):
+    try:
+        await add_score_rollups(function_key, version, score_deltas(added, removed))
+    except Exception as e:
+        # The evaluations are stored; only the summary is behind
+        print(f"Error updating score rollups for {function_key}: {e}")
+
+
+def submit_test_set_evaluation(
+    username: str, function: Dict[str, Any], version: str, tests: List[Dict[str, Any]]
+) -> Job:
+    """Queue grading of `tests` against `version`; the calls are stored when all are graded."""
+    function_key = function["function_key"]
+
+    def grade(batch):
+        return lambda: evaluate_tests(function, version, batch)
+
+    async def store(batches):
+        calls = [call for batch in batches for call in batch]
+        await put_calls(function_key, version, calls)
+        await record_scores(function_key, version, [call["evaluation"] for call in calls])
+        return {
+            "function_key": function_key,
+            "version": version,
+            "calls": len(calls),
+            "failed": sum(call["status"] == "failed" for call in calls),
+        }
+
+    return evaluation_jobs.submit(
+        username,
+        "test_set",
+        [grade(batch) for batch in test_batches(tests)],
+        store,
+        max_concurrency=EVALUATION_CONCURRENCY,
+    )
+
+
+def submit_call_evaluation(
+    username: str,
+    function: Dict[str, Any],
+    version: str,
+    call: Dict[str, Any],
+    metrics: List[str],
+) -> Job:
+    """Queue grading of a stored call and write the evaluation back to it."""
+    keys = {
+        "function_version": call_partition_key(function["function_key"], version),
+        "call_sort_key": call_sort_key(call["timestamp"], call["call_key"]),
+    }
+
+    async def grade():
+        return await evaluate_output(function["task"], metrics, call["inputs"], call["outputs"])
+
+    async def store(results):
+        evaluation = results[0]
+        await update_call_fields(keys, {"evaluation": evaluation, "status": "evaluated"})
+        # A re-evaluated call replaces its previous scores
+        await record_scores(
+            function["function_key"], version, [evaluation], [call.get("evaluation")]
+        )
+        return {"call_key": call["call_key"], "evaluation": evaluation}
+
+    async def on_failure(error):
+        # Otherwise the call would be left "evaluating" for good
+        log = {"message": f"Evaluation failed: {error}", "timestamp": datetime.utcnow().isoformat()}
+        await update_call_fields(keys, {"status": "failed", "logs": list(call.get("logs") or []) + [log]})
+
+    return evaluation_jobs.submit(username, "call", [grade], store, on_failure=on_failure)
@@ -1,13 +1,35 @@
 # api/main.py
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+import time
+import secrets
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from routers import auth, stripe_integration, function_management, evaluation_endpoints, aether_api_endpoints
-from config import HOST, PORT
+from config import HOST, PORT, METRICS_ENABLED, METRICS_TOKEN
+from utils import connect_dynamodb, close_dynamodb, StorageStats, storage_stats, api_key_cache, function_cache, verify_token
+from responses import FastJSONResponse
+from jobs import evaluation_jobs
+from CompiledSchema import compiled_schema_cache
+from metrics import registry, http_request_duration, Gauge
+import Evaluation
+import openai_client
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await connect_dynamodb()
+    evaluation_jobs.start()
+    yield
+    await evaluation_jobs.stop()
+    await openai_client.client.close()
+    await close_dynamodb()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -16,8 +38,100 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Storage-Round-Trips"],
 )
 
+
+@app.middleware("http")
+async def count_storage_round_trips(request: Request, call_next):
+    stats = StorageStats()
+    token = storage_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        storage_stats.reset(token)
+    response.headers["X-Storage-Round-Trips"] = str(stats.round_trips)
+    return response
+
+
+if METRICS_ENABLED:
+
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        started = time.perf_counter()
+        status = "500"
+        try:
+            response = await call_next(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            # Label by route template, never the raw path, to bound cardinality
+            route = request.scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                method=request.method,
+                route=route.path if route is not None else "unmatched",
+                status=status,
+            )
+
+    registry.register(
+        Gauge(
+            "openai_concurrency_limit",
+            "Current adaptive concurrency limit for OpenAI requests.",
+            lambda: openai_client.openai_limiter.limit,
+        )
+    )
+    registry.register(
+        Gauge(
+            "openai_requests_in_flight",
+            "OpenAI requests currently in flight.",
+            lambda: openai_client.openai_limiter.in_flight,
+        )
+    )
+    registry.register(
+        Gauge(
+            "evaluation_job_steps_queued",
+            "Evaluation job steps waiting for a worker.",
+            lambda: evaluation_jobs.stats()["queued_steps"],
+        )
+    )
+
+    def verify_metrics_token(request: Request):
+        if METRICS_TOKEN is None:
+            return
+        authorization = request.headers.get("authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token"
+            )
+
+    @app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(verify_metrics_token)])
+    def metrics():
+        return PlainTextResponse(
+            registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
+@app.get("/cache_stats")
+def cache_stats(user_email: str = Depends(verify_token)):
+    return {
+        "api_keys": api_key_cache.stats(),
+        "functions": function_cache.stats(),
+        "evaluations": Evaluation.evaluation_cache_stats(),
+        "schemas": compiled_schema_cache.stats(),
+    }
+
+
+@app.get("/job_stats")
+def job_stats(user_email: str = Depends(verify_token)):
+    return evaluation_jobs.stats()
+
+
+@app.get("/openai_stats")
+def openai_stats(user_email: str = Depends(verify_token)):
+    return openai_client.openai_limiter.stats()
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(stripe_integration.router)
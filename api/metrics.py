@@ -0,0 +1,230 @@
+# api/metrics.py
+#
+# Minimal Prometheus-style metrics, rendered in the text exposition format
+# at /metrics. Label values are capped per metric (`max_series`); new
+# combinations past the cap are counted under a single overflow series, so
+# a bad label can't grow memory without bound.
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+OVERFLOW = "__overflow__"
+
+# Seconds; covers a cache hit through a slow model response
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bytes
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Tokens
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), max_series: int = 500):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.max_series = max_series
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        if key not in self._series and len(self._series) >= self.max_series:
+            return tuple(OVERFLOW for _ in self.labels)
+        return key
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in series
+        ]
+
+
+class Gauge(_Metric):
+    """A value read from `callback` when metrics are scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float]):
+        super().__init__(name, help)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return self.header() + [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        max_series: int = 500,
+    ):
+        super().__init__(name, help, labels, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last is +Inf), then sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        lines = self.header()
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template and status.",
+        ["method", "route", "status"],
+    )
+)
+dynamodb_request_duration = registry.register(
+    Histogram(
+        "dynamodb_request_duration_seconds",
+        "DynamoDB request latency by operation and outcome.",
+        ["operation", "status"],
+    )
+)
+dynamodb_write_bytes = registry.register(
+    Histogram(
+        "dynamodb_write_request_bytes",
+        "Size of DynamoDB write request bodies.",
+        ["operation"],
+        buckets=SIZE_BUCKETS,
+    )
+)
+openai_request_duration = registry.register(
+    Histogram(
+        "openai_request_duration_seconds",
+        "OpenAI request latency by model, lane and outcome, per attempt.",
+        ["model", "lane", "status"],
+    )
+)
+openai_tokens = registry.register(
+    Counter(
+        "openai_tokens_total",
+        "Tokens reported by OpenAI responses.",
+        ["model", "lane", "type"],
+    )
+)
+openai_request_tokens = registry.register(
+    Histogram(
+        "openai_request_tokens",
+        "Total tokens per OpenAI request.",
+        ["model", "lane"],
+        buckets=TOKEN_BUCKETS,
+    )
+)
+
+# DynamoDB operations that write items
+_WRITE_OPERATIONS = {"PutItem", "UpdateItem", "DeleteItem", "BatchWriteItem", "TransactWriteItems"}
+
+
+def _before_dynamodb_call(model, params, context, **kwargs):
+    context["metrics_started"] = time.perf_counter()
+    if model.name in _WRITE_OPERATIONS:
+        dynamodb_write_bytes.observe(len(params.get("body") or b""), operation=model.name)
+
+
+def _after_dynamodb_call(http_response, model, context, **kwargs):
+    started = context.get("metrics_started")
+    if started is not None:
+        dynamodb_request_duration.observe(
+            time.perf_counter() - started,
+            operation=model.name,
+            status=str(http_response.status_code),
+        )
+
+
+def _after_dynamodb_call_error(model, context, **kwargs):
+    started = context.get("metrics_started")
+    if started is not None:
+        dynamodb_request_duration.observe(
+            time.perf_counter() - started, operation=model.name, status="error"
+        )
+
+
+def instrument_dynamodb(client):
+    """Time every request made by a (aio)botocore DynamoDB client."""
+    events = client.meta.events
+    events.register("before-call.dynamodb", _before_dynamodb_call)
+    events.register("after-call.dynamodb", _after_dynamodb_call)
+    events.register("after-call-error.dynamodb", _after_dynamodb_call_error)
@@ -0,0 +1,162 @@
+# api/migrations.py
+#
+# One-off data migrations. Run from the api directory:
+#   python migrations.py api_keys
+
+import sys
+import asyncio
+from botocore.exceptions import ClientError
+import utils
+from utils import put_calls, save_user, function_cache
+from VersionTree import get_version_index
+from rollups import score_deltas
+
+
+async def scan_users(**kwargs):
+    response = await utils.user_table.scan(**kwargs)
+    for item in response.get("Items", []):
+        yield item
+    while "LastEvaluatedKey" in response:
+        response = await utils.user_table.scan(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        for item in response.get("Items", []):
+            yield item
+
+
+async def scan_functions(**kwargs):
+    response = await utils.function_table.scan(**kwargs)
+    for item in response.get("Items", []):
+        yield item
+    while "LastEvaluatedKey" in response:
+        response = await utils.function_table.scan(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        for item in response.get("Items", []):
+            yield item
+
+
+async def backfill_api_keys():
+    # Index every existing user's api key so lookups no longer need a scan
+    count = 0
+    async with utils.api_key_table.batch_writer() as batch:
+        async for user in scan_users(ProjectionExpression="username, api_key"):
+            if "api_key" not in user:
+                continue
+            await batch.put_item(Item={"api_key": user["api_key"], "username": user["username"]})
+            count += 1
+    print(f"Indexed {count} api keys")
+
+
+async def move_calls(function):
+    # Move calls embedded in version_map into the calls table
+    count = 0
+    for version, version_data in function.get("version_map", {}).items():
+        calls = version_data.pop("calls", None)
+        if calls is None:
+            continue
+        await put_calls(function["function_key"], version, calls)
+        count += len(calls)
+    return count
+
+
+async def split_embedded_calls():
+    count = 0
+    async for user in scan_users():
+        moved = 0
+        for function in user.get("functions", []):
+            moved += await move_calls(function)
+        if moved:
+            await save_user(user)
+        count += moved
+    print(f"Moved {count} calls")
+
+
+async def split_functions():
+    # Store each embedded function as its own item, then drop the list from
+    # the user document. Any calls still embedded are moved as well.
+    count = 0
+    async for user in scan_users():
+        functions = user.pop("functions", None)
+        if functions is None:
+            continue
+        async with utils.function_table.batch_writer() as batch:
+            for function in functions:
+                await move_calls(function)
+                await batch.put_item(Item={**function, "username": user["username"]})
+                count += 1
+        await save_user(user)
+    print(f"Moved {count} functions")
+
+
+async def index_version_trees():
+    # Replace each nested version_tree with the flat version_index
+    count = 0
+    async for function in scan_functions(ProjectionExpression="username, function_key, version_tree, version_index"):
+        if "version_index" in function or "version_tree" not in function:
+            continue
+        index, root = get_version_index(function)
+        try:
+            await utils.function_table.update_item(
+                Key={"username": function["username"], "function_key": function["function_key"]},
+                UpdateExpression="SET version_index = :index, root_version = :root ADD #revision :one REMOVE version_tree",
+                # update_parameters may have indexed it since the scan
+                ConditionExpression="attribute_not_exists(version_index)",
+                ExpressionAttributeNames={"#revision": "revision"},
+                ExpressionAttributeValues={":index": index, ":root": root, ":one": 1},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            continue
+        finally:
+            function_cache.pop((function["username"], function["function_key"]))
+        count += 1
+    print(f"Indexed {count} version trees")
+
+
+async def scan_calls(**kwargs):
+    response = await utils.calls_table.scan(**kwargs)
+    for item in response.get("Items", []):
+        yield item
+    while "LastEvaluatedKey" in response:
+        response = await utils.calls_table.scan(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        for item in response.get("Items", []):
+            yield item
+
+
+async def build_score_rollups():
+    # Recompute every version's rollups from its calls. Items are overwritten,
+    # so this is safe to re-run; run it while no evaluations are in flight.
+    evaluations = {}
+    async for call in scan_calls(ProjectionExpression="function_version, evaluation"):
+        evaluations.setdefault(call["function_version"], []).append(call.get("evaluation"))
+    count = 0
+    async with utils.rollups_table.batch_writer() as batch:
+        for function_version, version_evaluations in evaluations.items():
+            for metric, rollup in score_deltas(version_evaluations).items():
+                await batch.put_item(
+                    Item={"function_version": function_version, "metric": metric, **utils.to_dynamo(rollup)}
+                )
+                count += 1
+    print(f"Built {count} score rollups")
+
+
+MIGRATIONS = {
+    "api_keys": backfill_api_keys,
+    "calls": split_embedded_calls,
+    "functions": split_functions,
+    "version_index": index_version_trees,
+    "rollups": build_score_rollups,
+}
+
+
+async def run(name):
+    await utils.connect_dynamodb()
+    try:
+        await MIGRATIONS[name]()
+    finally:
+        await utils.close_dynamodb()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in MIGRATIONS:
+        print(f"Usage: python migrations.py [{'|'.join(MIGRATIONS)}]")
+        sys.exit(1)
+    asyncio.run(run(sys.argv[1]))
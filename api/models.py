@@ -70,6 +70,14 @@ class EvaluationOutput(BaseModel):
     analysis: str
     scores: Dict[str, int]
 
+class BatchEvaluationItem(BaseModel):
+    index: int
+    analysis: str
+    scores: Dict[str, int]
+
+class BatchEvaluationOutput(BaseModel):
+    evaluations: List[BatchEvaluationItem]
+
 class EvaluateCallInput(BaseModel):
     input: Dict[str, Any]
     output: Dict[str, Any]
@@ -79,6 +87,15 @@ class CreateCallRequest(BaseModel):
     outputs: Dict[str, Any]
     logs: Optional[List[Dict[str, Any]]] = None
 
+class BulkCallRecord(BaseModel):
+    function_key: str
+    version: str
+    inputs: Dict[str, Any]
+    outputs: Dict[str, Any]
+    logs: Optional[List[Dict[str, Any]]] = None
+    evaluation: Optional[Dict[str, Any]] = None
+    status: Optional[str] = None
+
 class UpdateCallRequest(BaseModel):
     inputs: Optional[Dict[str, Any]] = None
     outputs: Optional[Dict[str, Any]] = None
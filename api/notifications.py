@@ -0,0 +1,90 @@
+# api/notifications.py
+
+import asyncio
+from typing import Any, Dict, List, Set, Tuple
+from config import FUNCTION_EVENTS_POLL_INTERVAL
+from utils import load_function
+
+FunctionId = Tuple[str, str]  # (username, function_key)
+
+
+class FunctionEvents:
+    """In-process fan-out of function changes to subscribed SDK clients.
+
+    One watcher task per subscribed function reads its revision and
+    current_version. It wakes immediately when this process publishes a
+    write, and otherwise re-reads every `poll_interval` seconds, which picks
+    up writes made by other workers.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[FunctionId, Set[asyncio.Queue]] = {}
+        self._wakeups: Dict[FunctionId, asyncio.Event] = {}
+        self._state: Dict[FunctionId, Dict[str, Any]] = {}
+
+    def subscribe(self, username: str, function_keys: List[str]) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for function_key in function_keys:
+            key = (username, function_key)
+            self._subscribers.setdefault(key, set()).add(queue)
+            if key in self._state:
+                queue.put_nowait(self._state[key])
+            if key not in self._wakeups:
+                self._wakeups[key] = asyncio.Event()
+                asyncio.create_task(self._watch(key))
+        return queue
+
+    def unsubscribe(self, username: str, function_keys: List[str], queue: asyncio.Queue):
+        for function_key in function_keys:
+            key = (username, function_key)
+            subscribers = self._subscribers.get(key)
+            if subscribers is None:
+                continue
+            subscribers.discard(queue)
+            if not subscribers:
+                # The watcher notices and exits on its next pass
+                del self._subscribers[key]
+                self._wakeups[key].set()
+
+    def publish(self, username: str, function_key: str):
+        wakeup = self._wakeups.get((username, function_key))
+        if wakeup is not None:
+            wakeup.set()
+
+    async def _watch(self, key: FunctionId):
+        username, function_key = key
+        wakeup = self._wakeups[key]
+        try:
+            while key in self._subscribers:
+                try:
+                    function = await load_function(
+                        username,
+                        function_key,
+                        ["function_key", "revision", "current_version"],
+                        consistent=True,
+                    )
+                except Exception as e:
+                    print(f"Error watching function {function_key}: {e}")
+                    function = None
+                if function:
+                    state = {
+                        "function_key": function_key,
+                        "revision": int(function.get("revision", 0)),
+                        "current_version": function.get("current_version"),
+                    }
+                    if state != self._state.get(key):
+                        self._state[key] = state
+                        for queue in self._subscribers.get(key, ()):
+                            queue.put_nowait(state)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+        finally:
+            self._wakeups.pop(key, None)
+            self._state.pop(key, None)
+
+
+function_events = FunctionEvents(FUNCTION_EVENTS_POLL_INTERVAL)
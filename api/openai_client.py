@@ -0,0 +1,92 @@
+# api/openai_client.py
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+import httpx
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_TIMEOUT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_INITIAL_CONCURRENCY,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_BACKOFF_BASE,
+    OPENAI_BACKOFF_CAP,
+)
+from rate_limiter import AdaptiveLimiter, RetryableError
+from metrics import openai_request_duration, openai_tokens, openai_request_tokens
+import time
+
+# Retries are scheduled by openai_limiter, so the client itself never retries
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=OPENAI_TIMEOUT,
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=OPENAI_TIMEOUT,
+    ),
+)
+
+# Shared by every OpenAI request this process makes
+openai_limiter = AdaptiveLimiter(
+    initial_concurrency=OPENAI_INITIAL_CONCURRENCY,
+    max_concurrency=OPENAI_MAX_CONCURRENCY,
+    max_retries=OPENAI_MAX_RETRIES,
+    backoff_base=OPENAI_BACKOFF_BASE,
+    backoff_cap=OPENAI_BACKOFF_CAP,
+)
+
+# Budget for the completion when estimating a request's token cost
+COMPLETION_TOKENS_ESTIMATE = 512
+
+
+def estimate_tokens(messages):
+    # Roughly four characters per token
+    return sum(len(message["content"]) for message in messages) // 4 + COMPLETION_TOKENS_ESTIMATE
+
+
+async def chat_completion(lane="interactive", timeout=None, **kwargs):
+    """client.chat.completions.create() through the shared rate limiter.
+
+    `lane` is "interactive" for work a caller is waiting on and "bulk" for
+    background work, which yields to it. `timeout` bounds each attempt once
+    the limiter has admitted it.
+    """
+    model = kwargs.get("model", "")
+
+    async def request():
+        started = time.perf_counter()
+        status = "error"
+        try:
+            raw = await client.chat.completions.with_raw_response.create(**kwargs)
+            status = str(raw.status_code)
+        except APIStatusError as e:
+            status = str(e.status_code)
+            if e.status_code == 429 or e.status_code >= 500:
+                raise RetryableError(e, e.response.headers, e.status_code == 429)
+            raise
+        except APIConnectionError as e:
+            # Includes timeouts
+            raise RetryableError(e, {}, False)
+        finally:
+            openai_request_duration.observe(
+                time.perf_counter() - started, model=model, lane=lane, status=status
+            )
+        response = raw.parse()
+        _record_usage(response, model, lane)
+        return response, raw.headers
+
+    return await openai_limiter.run(request, estimate_tokens(kwargs["messages"]), lane, timeout)
+
+
+def _record_usage(response, model, lane):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    openai_tokens.inc(usage.prompt_tokens, model=model, lane=lane, type="prompt")
+    openai_tokens.inc(usage.completion_tokens, model=model, lane=lane, type="completion")
+    openai_request_tokens.observe(usage.total_tokens, model=model, lane=lane)
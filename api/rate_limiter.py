@@ -0,0 +1,245 @@
+# api/rate_limiter.py
+
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+# Lower runs first: requests made on behalf of a waiting user go ahead of
+# background work such as test-set grading
+LANES = {"interactive": 0, "bulk": 1}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    # Rate-limit reset headers look like "20ms", "1s" or "6m0s"
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class RetryableError(Exception):
+    """Raised by a request to ask AdaptiveLimiter.run() to retry it."""
+
+    def __init__(self, error: Exception, headers: Mapping[str, str], throttled: bool):
+        super().__init__(str(error))
+        self.error = error
+        self.headers = headers
+        self.throttled = throttled
+
+
+class AdaptiveLimiter:
+    """Shared gate for outbound requests to a rate-limited API.
+
+    Concurrency follows AIMD: every success raises the limit by 1/limit
+    (about one slot per round of requests) and a throttled response halves
+    it, at most once per `decrease_cooldown` seconds so one burst of 429s
+    counts once. The remaining request and token budgets reported in
+    x-ratelimit-* response headers are tracked as well. Once a budget is
+    used up, requests wait for its reset instead of being sent to fail.
+    Waiters are admitted by lane, then in arrival order.
+    """
+
+    decrease_cooldown = 1.0
+
+    def __init__(
+        self,
+        initial_concurrency: int,
+        max_concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_cap: float,
+        min_concurrency: int = 1,
+    ):
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.in_flight = 0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._order = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def run(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        tokens: int = 0,
+        lane: str = "interactive",
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Run `request` when capacity allows, retrying with jittered backoff.
+
+        `request` returns (result, response_headers), or raises
+        RetryableError for throttling and transient failures. `timeout`
+        bounds each attempt once it has capacity, not the time spent
+        waiting for it; an attempt that overruns raises asyncio.TimeoutError.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(tokens, lane)
+            try:
+                result, headers = await asyncio.wait_for(request(), timeout)
+            except RetryableError as e:
+                self._observe(e.headers)
+                if e.throttled:
+                    self._throttle(e.headers)
+                self.release()
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    raise e.error
+                delay = self._retry_delay(attempt, e.headers)
+            except BaseException:
+                self.release()
+                raise
+            else:
+                self._observe(headers)
+                self._increase()
+                self.release()
+                return result
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def acquire(self, tokens: int = 0, lane: str = "interactive"):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANES[lane], next(self._order), tokens, future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled; hand the slot back
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": sum(not waiter[3].done() for waiter in self._waiters),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    def _wake(self):
+        now = time.monotonic()
+        if now >= self.requests_reset_at:
+            self.remaining_requests = None
+        if now >= self.tokens_reset_at:
+            self.remaining_tokens = None
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= max(int(self.limit), self.min_concurrency):
+                return
+            wait = self._budget_wait(tokens, now)
+            if wait > 0:
+                self._wake_later(wait)
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self.requests += 1
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= tokens
+            future.set_result(None)
+
+    def _budget_wait(self, tokens: int, now: float) -> float:
+        wait = self.blocked_until - now
+        if self.remaining_requests is not None and self.remaining_requests < 1:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+        return wait
+
+    def _wake_later(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _observe(self, headers: Mapping[str, str]):
+        now = time.monotonic()
+        remaining = _header_int(headers, "x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if remaining is not None and reset is not None:
+            self.remaining_requests = remaining
+            self.requests_reset_at = now + reset
+        remaining = _header_int(headers, "x-ratelimit-remaining-tokens")
+        reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        if remaining is not None and reset is not None:
+            self.remaining_tokens = remaining
+            self.tokens_reset_at = now + reset
+
+    def _increase(self):
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _throttle(self, headers: Mapping[str, str]):
+        now = time.monotonic()
+        self.throttled += 1
+        delay = retry_after(headers)
+        if delay is not None:
+            self.blocked_until = max(self.blocked_until, now + delay)
+        if now - self._last_decrease >= self.decrease_cooldown:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self._last_decrease = now
+
+    def _retry_delay(self, attempt: int, headers: Mapping[str, str]) -> float:
+        # Full jitter, so retries from a burst don't arrive together
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        server_delay = retry_after(headers)
+        if server_delay is not None:
+            delay = server_delay + random.uniform(0, self.backoff_base)
+        return delay
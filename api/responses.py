@@ -0,0 +1,87 @@
+# api/responses.py
+
+import gzip
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from config import COMPRESSION_MIN_SIZE, GZIP_LEVEL, ZSTD_LEVEL
+
+# Optional: zstd content-encoding and MessagePack bodies when installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def _default(obj: Any) -> Any:
+    # DynamoDB returns every number as Decimal
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_default)
+
+
+def _accepted_encodings(request: Request) -> set:
+    header = request.headers.get("accept-encoding", "")
+    return {part.split(";")[0].strip().lower() for part in header.split(",")}
+
+
+def negotiated_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Serialize `content` straight to bytes, skipping jsonable_encoder.
+
+    Bodies are MessagePack if the client accepts it and msgpack is installed,
+    JSON otherwise, and are compressed with zstd or gzip above
+    COMPRESSION_MIN_SIZE bytes.
+    """
+    if msgpack is not None and MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        response = MsgPackResponse(content, status_code=status_code, headers=headers)
+    else:
+        response = FastJSONResponse(content, status_code=status_code, headers=headers)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+
+    if len(response.body) < COMPRESSION_MIN_SIZE:
+        return response
+    encodings = _accepted_encodings(request)
+    if zstandard is not None and "zstd" in encodings:
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(response.body)
+        encoding = "zstd"
+    elif "gzip" in encodings:
+        body = gzip.compress(response.body, compresslevel=GZIP_LEVEL)
+        encoding = "gzip"
+    else:
+        return response
+    response.body = body
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(body))
+    return response
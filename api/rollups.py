@@ -0,0 +1,108 @@
+# api/rollups.py
+#
+# Per-(function, version, metric) score aggregates, kept up to date as
+# evaluations are recorded so summaries never read the calls themselves.
+#
+# A rollup is a flat map of counters: count, sum, sumsq and one bucket per
+# integer score on the grader's 0-100 scale ("b0".."b100"). Every field is
+# additive, so rollups are updated with DynamoDB ADD and merge by summing.
+# The buckets are unit-width, which makes min, max and quantiles exact for
+# the integer scores the grader returns.
+
+import math
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+MAX_SCORE = 100
+SCORE_TYPES = (int, float, Decimal)
+
+
+def bucket_name(score: float) -> str:
+    return f"b{min(MAX_SCORE, max(0, int(round(score))))}"
+
+
+def numeric_scores(evaluation: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    scores = (evaluation or {}).get("scores") or {}
+    return {
+        metric: float(value)
+        for metric, value in scores.items()
+        if isinstance(value, SCORE_TYPES) and not isinstance(value, bool)
+    }
+
+
+def score_deltas(
+    added: Iterable[Optional[Dict[str, Any]]],
+    removed: Iterable[Optional[Dict[str, Any]]] = (),
+) -> Dict[str, Dict[str, float]]:
+    """Counter changes per metric for evaluations added and replaced."""
+    deltas: Dict[str, Dict[str, float]] = {}
+    for evaluations, sign in ((added, 1), (removed, -1)):
+        for evaluation in evaluations:
+            for metric, score in numeric_scores(evaluation).items():
+                delta = deltas.setdefault(metric, {})
+                for field, amount in (
+                    ("count", 1),
+                    ("sum", score),
+                    ("sumsq", score * score),
+                    (bucket_name(score), 1),
+                ):
+                    delta[field] = delta.get(field, 0) + sign * amount
+    # Drop fields that cancelled out, e.g. a re-evaluation with the same score
+    return {
+        metric: {field: amount for field, amount in delta.items() if amount}
+        for metric, delta in deltas.items()
+    }
+
+
+def _is_counter(field: str) -> bool:
+    return field in ("count", "sum", "sumsq") or (field[:1] == "b" and field[1:].isdigit())
+
+
+def merge_rollups(rollups: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    merged: Dict[str, float] = {}
+    for rollup in rollups:
+        for field, amount in rollup.items():
+            if _is_counter(field):
+                merged[field] = merged.get(field, 0) + float(amount)
+    return merged
+
+
+def _quantile(histogram: List[float], count: float, q: float) -> Optional[int]:
+    # Smallest score with at least q of the values at or below it
+    rank = q * count
+    seen = 0.0
+    for score, n in enumerate(histogram):
+        seen += n
+        if n and seen >= rank:
+            return score
+    return None
+
+
+def summarize(rollup: Dict[str, Any]) -> Dict[str, Any]:
+    count = float(rollup.get("count", 0))
+    if count <= 0:
+        return {"count": 0}
+    total = float(rollup.get("sum", 0))
+    mean = total / count
+    variance = max(0.0, float(rollup.get("sumsq", 0)) / count - mean * mean)
+    histogram = [float(rollup.get(f"b{score}", 0)) for score in range(MAX_SCORE + 1)]
+    present = [score for score, n in enumerate(histogram) if n > 0]
+    return {
+        "count": int(count),
+        "sum": total,
+        "mean": mean,
+        "stddev": math.sqrt(variance),
+        "min": present[0] if present else None,
+        "max": present[-1] if present else None,
+        "p50": _quantile(histogram, count, 0.5),
+        "p90": _quantile(histogram, count, 0.9),
+        "p99": _quantile(histogram, count, 0.99),
+    }
+
+
+def summarize_version(rollups: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Summary per metric plus `overall`, pooling every metric's scores."""
+    return {
+        "metrics": {metric: summarize(rollup) for metric, rollup in rollups.items()},
+        "overall": summarize(merge_rollups(rollups.values())),
+    }
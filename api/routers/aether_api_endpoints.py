@@ -1,49 +1,117 @@
 # api/routers/aether_api_endpoints.py
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Body
-from utils import verify_token, get_user, save_user, save_function, find_user_by_api_key, find_function_by_api_and_function_key, is_version_tree_enabled
-from Evaluation import evaluate_output
-from models import ParameterUpdateRequest, CreateCallRequest, UpdateCallRequest, EvaluateCallInput
-from typing import Any
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Body, Query
+from fastapi.responses import StreamingResponse
+from utils import verify_token, find_username_by_api_key, find_function_by_api_and_function_key, load_function, update_function, is_version_tree_enabled, put_call, put_call_batch, query_calls, parse_fields, load_function_fields, get_score_rollups, function_cache
+from unit_of_work import UnitOfWork, get_unit_of_work
+from notifications import function_events
+from responses import negotiated_response
+from config import FUNCTION_EVENTS_KEEPALIVE, BULK_BATCH_SIZE, BULK_WRITE_CONCURRENCY, BULK_MAX_LINE_BYTES
+from jobs import evaluation_jobs, submit_call_evaluation, record_scores
+from CompiledSchema import call_schema_errors, FINISHED_STATUSES
+from rollups import summarize_version
+from export import export_calls_response
+from models import ParameterUpdateRequest, CreateCallRequest, UpdateCallRequest, EvaluateCallInput, BulkCallRecord
+from typing import Any, List, Optional
 from datetime import datetime
+import asyncio
+import hashlib
+import json
 import uuid
 
 router = APIRouter()
 
 
+def function_etag(function_key: str, revision: Any, variant: str = "") -> str:
+    # The revision changes on every write to the function. Weak, because the
+    # same content is served as JSON or msgpack, compressed or not.
+    digest = hashlib.sha1(f"{function_key}:{revision}:{variant}".encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses weak comparison
+    if not if_none_match:
+        return False
+    candidates = [_opaque_tag(tag) for tag in if_none_match.split(",")]
+    return "*" in candidates or _opaque_tag(etag) in candidates
+
+
+async def not_modified(request: Request, username: str, function_key: str, variant: str):
+    """Return a 304 response if the client's cached copy is still current."""
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return None
+    # Read the revision from the table, never from this worker's cache,
+    # which may predate a deploy made through another worker
+    current = await load_function(username, function_key, ["function_key", "revision"], consistent=True)
+    if not current:
+        raise HTTPException(status_code=404, detail="Function not found")
+    etag = function_etag(function_key, current.get("revision", 0), variant)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept, Accept-Encoding"})
+    # The client is behind; make sure the body it gets next isn't as well
+    cached = function_cache.get((username, function_key))
+    if cached is not None and cached.get("revision", 0) != current.get("revision", 0):
+        function_cache.pop((username, function_key))
+    return None
+
+
 @router.get("/function_data/{function_key}")
-def get_function_data(function_key: str, request: Request):
+async def get_function_data(function_key: str, request: Request, fields: Optional[str] = None):
     # Get the API key from headers
     api_key = request.headers.get("X-API-Key")
     if not api_key:
         raise HTTPException(status_code=401, detail="API key required")
 
     # Find the user with the given API key
-    user_data = find_user_by_api_key(api_key)
-    if not user_data:
+    username = await find_username_by_api_key(api_key)
+    if not username:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
-    # Find the function with the given function_key
-    function = next(
-        (f for f in user_data.get("functions", []) if f.get("function_key") == function_key),
-        None,
-    )
+    selected = parse_fields(fields)
+    # Calls change without bumping the function revision, so only
+    # responses without them can be validated by ETag
+    if selected is None or "calls" in selected:
+        function = await load_function_fields(username, function_key, selected)
+        if not function:
+            raise HTTPException(status_code=404, detail="Function not found")
+        return negotiated_response(request, function)
+
+    variant = ",".join(selected)
+    cached = await not_modified(request, username, function_key, variant)
+    if cached:
+        return cached
+
+    # Find the function with the given function_key, limited to `fields`
+    attributes = selected if "revision" in selected else selected + ["revision"]
+    function = await load_function_fields(username, function_key, attributes)
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
-
-    return function
+    revision = function.get("revision", 0) if "revision" in selected else function.pop("revision", 0)
+    return negotiated_response(
+        request, function, headers={"ETag": function_etag(function_key, revision, variant)}
+    )
 
 @router.get("/function_params/{function_key}/{version}")
-def get_parameters(
-    function_key: str, version: str, request: Request
+async def get_parameters(
+    function_key: str, version: str, request: Request, response: Response
 ):
     api_key = request.headers.get("X-API-Key")
-    user_data = find_user_by_api_key(api_key)
-    
-    function = next(
-        (f for f in user_data.get("functions", []) if f.get("function_key") == function_key),
-        None,
-    )
+    username = await find_username_by_api_key(api_key)
+    if not username:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    cached = await not_modified(request, username, function_key, f"params:{version}")
+    if cached:
+        return cached
+
+    function = await load_function(username, function_key)
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
 
@@ -53,23 +121,22 @@ def get_parameters(
 
     parameters = version_data.get("parameters", {})
     parameters["output_schema"] = function.get("output_schema", {})
+    response.headers["ETag"] = function_etag(
+        function_key, function.get("revision", 0), f"params:{version}"
+    )
     return {"parameters": parameters}
 
 
 @router.get("/function_param/{function_key}/{parameter}/{version}")
 @router.get("/function_param/{function_key}/{parameter}")
-def get_parameter(
+async def get_parameter(
     function_key: str,
     version: str,
     parameter: str,
     request: Request,
 ):
     api_key = request.headers.get("X-API-Key")
-    user_data = find_user_by_api_key(api_key)
-    function = next(
-        (f for f in user_data.get("functions", []) if f.get("function_key") == function_key),
-        None,
-    )
+    function = await find_function_by_api_and_function_key(api_key, function_key)
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
 
@@ -85,33 +152,99 @@ def get_parameter(
 
 
 @router.post("/function_params/{function_key}/{version}/{parameter}")
-def set_parameter(
+async def set_parameter(
     function_key: str,
     version: str,
     parameter: str,
-    request: ParameterUpdateRequest,
-    
+    request: Request,
+    update: ParameterUpdateRequest,
 ):
     api_key = request.headers.get("X-API-Key")
-    user_data = find_user_by_api_key(api_key)
-    function = next(
-        (f for f in user_data.get("functions", []) if f.get("function_key") == function_key),
-        None,
+    username = await find_username_by_api_key(api_key)
+    if not username:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
+    # Write only this parameter, provided the version exists
+    updated = await update_function(
+        username,
+        function_key,
+        {("version_map", version, "parameters", parameter): update.value},
+        must_exist=[("version_map", version, "parameters")],
     )
-    if not function:
-        raise HTTPException(status_code=404, detail="Function not found")
+    if not updated:
+        raise HTTPException(status_code=404, detail="Function or version not found")
+    function_events.publish(username, function_key)
 
-    version_data = function["version_map"].get(version)
-    if not version_data:
+    return {"message": "Parameter updated successfully"}
+
+
+@router.get("/function_events")
+async def stream_function_events(
+    request: Request,
+    function_keys: str = Query(...),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+):
+    # Server-Sent Events: one event per change to current_version or revision,
+    # starting with the current state of each function
+    username = await uow.username()
+    keys = parse_fields(function_keys) or []
+    for function_key in keys:
+        await uow.function(function_key)
+
+    queue = function_events.subscribe(username, keys)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), FUNCTION_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: function\ndata: {json.dumps(event)}\n\n"
+        finally:
+            function_events.unsubscribe(username, keys, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/calls/{function_key}/{version}")
+async def list_calls(
+    function_key: str,
+    version: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+):
+    function = await uow.function(function_key)
+    if version not in function["version_map"]:
         raise HTTPException(status_code=404, detail="Version not found")
 
-    version_data.setdefault("parameters", {})[parameter] = request.value
-    save_user(user_data)
+    calls, next_cursor = await query_calls(function_key, version, limit, cursor, status)
+    return {"calls": calls, "next_cursor": next_cursor}
 
-    return {"message": "Parameter updated successfully"}
+@router.get("/export_calls/{function_key}")
+async def export_calls(
+    function_key: str,
+    format: str = "ndjson",
+    versions: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    uow: UnitOfWork = Depends(get_unit_of_work),
+):
+    function = await uow.function(function_key)
+    selected = parse_fields(versions) or list(function["version_map"])
+    if any(version not in function["version_map"] for version in selected):
+        raise HTTPException(status_code=404, detail="Version not found")
+    return export_calls_response(function_key, selected, format, status, since, until)
 
 @router.post("/create_call/{function_key}/{version}")
-def create_call(
+async def create_call(
     function_key: str,
     version: str,
     request: Request,
@@ -123,15 +256,12 @@ def create_call(
         raise HTTPException(status_code=401, detail="API key required")
 
     # Find the user with the given API key
-    user_data = find_user_by_api_key(api_key)
-    if not user_data:
+    username = await find_username_by_api_key(api_key)
+    if not username:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
     # Find the function with the given function_key
-    function = next(
-        (f for f in user_data.get("functions", []) if f.get("function_key") == function_key),
-        None,
-    )
+    function = await load_function(username, function_key)
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
 
@@ -140,6 +270,11 @@ def create_call(
     if not version_data:
         raise HTTPException(status_code=404, detail="Version not found")
 
+    # Empty inputs and outputs are filled in later by update_call
+    errors = call_schema_errors(function, call_data.inputs or None, call_data.outputs or None)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
     # Create a new call
     call_key = uuid.uuid4().hex
     call = {
@@ -151,95 +286,209 @@ def create_call(
         "status": "pending",
         "timestamp": datetime.utcnow().isoformat(),
     }
-    # Add call to version's calls
-    version_data.setdefault("calls", []).append(call)
+    # Append the call to the calls table
+    await put_call(function_key, version, call)
 
-    # Save user data
-    save_user(user_data)
+    return {
+        "message": "Call created successfully",
+        "call_key": call_key,
+        "timestamp": call["timestamp"],
+    }
 
-    return {"message": "Call created successfully", "call_key": call_key}
+async def ndjson_lines(request: Request):
+    # Yields each line, or None in place of a line longer than
+    # BULK_MAX_LINE_BYTES; the rest of an oversized line is skipped
+    buffer = b""
+    oversized = False
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield None if oversized or len(line) > BULK_MAX_LINE_BYTES else line
+            oversized = False
+        if len(buffer) > BULK_MAX_LINE_BYTES:
+            oversized = True
+            buffer = b""
+    if oversized:
+        yield None
+    elif buffer:
+        yield buffer
+
+
+@router.post("/create_calls")
+async def create_calls(request: Request, uow: UnitOfWork = Depends(get_unit_of_work)):
+    # Body is newline-delimited JSON, one BulkCallRecord per line. Records are
+    # validated as they arrive and written in batches, up to
+    # BULK_WRITE_CONCURRENCY at once while reading continues; the response
+    # holds a call_key or an error for every record, keyed by line number.
+    await uow.username()
+    results = []
+    pending = []
+    in_flight = set()
+
+    async def write(batch):
+        try:
+            await put_call_batch([(fk, version, call) for _, fk, version, call in batch])
+        except Exception as e:
+            print(f"Error writing calls: {e}")
+            for index, *_ in batch:
+                results[index] = {"line": results[index]["line"], "error": "Failed to store call"}
+            return
+        # Keep the score rollups in step with evaluations stored up front
+        evaluations = {}
+        for _, fk, version, call in batch:
+            if call["evaluation"]:
+                evaluations.setdefault((fk, version), []).append(call["evaluation"])
+        await asyncio.gather(
+            *(record_scores(fk, version, added) for (fk, version), added in evaluations.items())
+        )
+
+    line_number = 0
+    try:
+        async for line in ndjson_lines(request):
+            line_number += 1
+            if line is None:
+                results.append({"line": line_number, "error": "Line too long"})
+                continue
+            if not line.strip():
+                continue
+            try:
+                record = BulkCallRecord.model_validate_json(line)
+                function = await uow.function(record.function_key)
+                if record.version not in function["version_map"]:
+                    raise HTTPException(status_code=404, detail="Version not found")
+                errors = call_schema_errors(function, record.inputs, record.outputs)
+                if errors:
+                    raise HTTPException(status_code=422, detail=errors)
+            except HTTPException as e:
+                results.append({"line": line_number, "error": e.detail})
+                continue
+            except ValueError as e:
+                results.append({"line": line_number, "error": str(e)})
+                continue
+
+            call_key = uuid.uuid4().hex
+            call = {
+                "call_key": call_key,
+                "inputs": record.inputs,
+                "outputs": record.outputs,
+                "logs": record.logs or [],
+                "evaluation": record.evaluation or {},
+                "status": record.status or "completed",
+                "timestamp": datetime.utcnow().isoformat(),
+            }
+            pending.append((len(results), record.function_key, record.version, call))
+            results.append({"line": line_number, "call_key": call_key})
+
+            if len(pending) >= BULK_BATCH_SIZE:
+                in_flight.add(asyncio.create_task(write(pending)))
+                pending = []
+                if len(in_flight) >= BULK_WRITE_CONCURRENCY:
+                    _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Never leave accepted records unwritten, even if reading failed
+        if pending:
+            in_flight.add(asyncio.create_task(write(pending)))
+        if in_flight:
+            await asyncio.wait(in_flight)
+    return {"results": results}
 
 @router.post("/update_call/{call_key}")
-def update_call(call_key: str, request: Request, call_data: UpdateCallRequest = Body(...)):
-    # Get the API key from headers
-    api_key = request.headers.get("X-API-Key")
-    if not api_key:
-        raise HTTPException(status_code=401, detail="API key required")
-
-    # Find the user with the given API key
-    function = find_function_by_api_and_function_key(api_key, call_data.function_key)
-    call = function["version_map"][call_data.version]["calls"]
-    call = next((c for c in call if c.get("call_key") == call_key), None)
-    if not call:
-        raise HTTPException(status_code=404, detail="Call not found")
-
-
-    if call_data.inputs is not None:
-        call['inputs'] = call_data.inputs
-    if call_data.outputs is not None:
-        call['outputs'] = call_data.outputs
-    if call_data.logs is not None:
-        call['logs'] = call_data.logs
+async def update_call(
+    call_key: str,
+    call_data: UpdateCallRequest = Body(...),
+    uow: UnitOfWork = Depends(get_unit_of_work),
+):
+    call = await uow.call(call_key, call_data.function_key, call_data.version, call_data.timestamp)
+    previous_evaluation = call.get("evaluation")
+    # Check the call as it will be stored, once it is finished and whenever
+    # its inputs, outputs or status change
+    changed = any(v is not None for v in (call_data.inputs, call_data.outputs, call_data.status))
+    if changed and (call_data.status or call.get("status")) in FINISHED_STATUSES:
+        errors = call_schema_errors(
+            await uow.function(call["function_key"]),
+            call_data.inputs if call_data.inputs is not None else call.get("inputs"),
+            call_data.outputs if call_data.outputs is not None else call.get("outputs"),
+        )
+        if errors:
+            raise HTTPException(status_code=422, detail=errors)
+    uow.update_call(
+        call_key,
+        {
+            "inputs": call_data.inputs,
+            "outputs": call_data.outputs,
+            "logs": call_data.logs,
+            "evaluation": call_data.evaluation,
+            "status": call_data.status,
+        },
+    )
+    await uow.commit()
     if call_data.evaluation is not None:
-        call['evaluation'] = call_data.evaluation
-    if call_data.status is not None:
-        call['status'] = call_data.status
-
-    # Save user data
-    save_function(api_key, function)
+        await record_scores(
+            call["function_key"], call["version"], [call_data.evaluation], [previous_evaluation]
+        )
 
     return {"message": "Call updated successfully"}
 
 @router.post("/evaluate_call/{function_key}/{version}/{call_key}")
-def evaluate_call(
+async def evaluate_call(
     function_key: str,
     version: str,
     call_key: str,
-    request: Request,
     data: UpdateCallRequest = Body(...),
+    uow: UnitOfWork = Depends(get_unit_of_work),
 ):
-    # Get the API key from headers
-    api_key = request.headers.get("X-API-Key")
-    if not api_key:
-        raise HTTPException(status_code=401, detail="API key required")
-    
     # get tier and if version tree is enabled
-    user_data = find_user_by_api_key(api_key)
-    tier = user_data.get("tier", "free")
+    tier = (await uow.user()).get("tier", "free")
     if not is_version_tree_enabled(tier):
         return {"evaluation": {}, "message": "Evaluation not allowed for this tier"}
-    function = find_function_by_api_and_function_key(api_key, function_key)
+    function = await uow.function(function_key)
 
     # Get the version data
     version_data = function["version_map"].get(version)
     if not version_data:
         raise HTTPException(status_code=404, detail="Version not found")
-    
-    # Evaluate the output if not a custom function and tier allows it
-    eval = evaluate_output(
-        function["task"],
-        function["metrics"],
-        data.inputs,
-        data.outputs,
-    )
-    
-    # save function_data
+
+    # Grade only calls that match the function's schemas
+    errors = call_schema_errors(function, data.inputs, data.outputs)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
     # find call with call_key
-    calls = version_data.get("calls", [])
-    call = next((c for c in calls if c.get("call_key") == call_key), None)
-    if not call:
-        raise HTTPException(status_code=404, detail="Call not found")
-    
-    if data.inputs is not None:
-        call['inputs'] = data.inputs
-    if data.outputs is not None:
-        call['outputs'] = data.outputs
-    if data.logs is not None:
-        call['logs'] = data.logs
-    if data.status is not None:
-        call['status'] = data.status
-    call['evaluation'] = eval
-    
-    # Save user data
-    save_function(api_key, function)
-    return {"evaluation": eval}
\ No newline at end of file
+    call = await uow.call(call_key, function_key, version, data.timestamp)
+
+    uow.update_call(
+        call_key,
+        {
+            "inputs": data.inputs,
+            "outputs": data.outputs,
+            "logs": data.logs,
+            "status": data.status,
+        },
+    )
+    await uow.commit()
+
+    # Grade in the background; the evaluation is written to the call
+    job = submit_call_evaluation(
+        await uow.username(), function, version, call, function["metrics"]
+    )
+    return {"job_id": job.job_id, "status": job.status}
+
+
+@router.get("/score_summary/{function_key}/{version}")
+async def get_score_summary(
+    function_key: str,
+    version: str,
+    uow: UnitOfWork = Depends(get_unit_of_work),
+):
+    # The function must belong to the caller
+    await uow.function(function_key)
+    return summarize_version(await get_score_rollups(function_key, version))
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, uow: UnitOfWork = Depends(get_unit_of_work)):
+    job = evaluation_jobs.get(job_id, await uow.username())
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
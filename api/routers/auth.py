@@ -1,25 +1,26 @@
 # api/routers/auth.py
 
 from fastapi import APIRouter, HTTPException, Depends, status
-from utils import get_user, save_user, generate_api_key
+from utils import get_user, save_user, generate_api_key, save_api_key
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 from config import GOOGLE_CLIENT_ID
 from datetime import datetime
+import asyncio
 
 router = APIRouter()
 
 
 @router.post("/auth/login")
-def login(data: dict):
+async def login(data: dict):
     token = data.get("token")
     if not token:
         raise HTTPException(status_code=400, detail="Token is required")
 
     try:
-        # Verify the token
-        idinfo = id_token.verify_oauth2_token(
-            token, google_requests.Request(), GOOGLE_CLIENT_ID
+        # Verify the token (blocking HTTP call, keep it off the event loop)
+        idinfo = await asyncio.to_thread(
+            id_token.verify_oauth2_token, token, google_requests.Request(), GOOGLE_CLIENT_ID
         )
 
         # Get user info
@@ -27,27 +28,28 @@ def login(data: dict):
         email = email.lower()
 
         # Check if user exists
-        user_data = get_user(email)
+        user_data = await get_user(email)
         if not user_data:
             # Create a new user
             user_api_key = generate_api_key()
             user_data = {
                 "username": email,
-                "functions": [],
                 "api_key": user_api_key,
                 "tier": "pro",  # Default tier
                 "created_at": str(datetime.now().strftime("%Y-%m-%d")),
             }
-            save_user(user_data)
+            await save_user(user_data)
+            await save_api_key(user_api_key, email)
         else:
             if "api_key" not in user_data:
                 # Generate API key for existing user if not present
                 user_api_key = generate_api_key()
                 user_data["api_key"] = user_api_key
-                save_user(user_data)
+                await save_user(user_data)
+                await save_api_key(user_api_key, email)
             if "tier" not in user_data:
                 user_data["tier"] = "pro"
-                save_user(user_data)
+                await save_user(user_data)
             user_api_key = user_data["api_key"]
 
         return {
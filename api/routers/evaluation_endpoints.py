@@ -2,9 +2,10 @@
 
 from fastapi import APIRouter, HTTPException, Depends, Body, Request
 from models import EvaluationInput
-from utils import verify_token, get_user, save_user, user_table
+from utils import verify_token, get_user, find_user_by_api_key, load_function, put_call
 from typing import Any
-from Evaluation import evaluate_output
+from jobs import submit_call_evaluation
+from CompiledSchema import call_schema_errors
 import uuid
 from datetime import datetime
 
@@ -12,7 +13,7 @@ router = APIRouter()
 
 
 @router.post("/evaluate")
-def evaluate_input_output_pair(input_data: EvaluationInput):
+async def evaluate_input_output_pair(input_data: EvaluationInput):
     task = input_data.task
     input_payload = input_data.input
     output_payload = input_data.output
@@ -21,18 +22,12 @@ def evaluate_input_output_pair(input_data: EvaluationInput):
     api_key = input_data.api_key
 
     # Find user with api_key
-    scan_kwargs = {
-        "FilterExpression": "api_key = :api_key",
-        "ExpressionAttributeValues": {":api_key": api_key},
-    }
-    response = user_table.scan(**scan_kwargs)
-    if "Items" not in response or len(response["Items"]) == 0:
+    user_data = await find_user_by_api_key(api_key)
+    if not user_data:
         print("Invalid API key")
         raise HTTPException(status_code=401, detail="Invalid API key")
-    user_data = response["Items"][0]
 
-    functions = user_data.get("functions", [])
-    function = next((f for f in functions if f.get("function_key") == function_key), None)
+    function = await load_function(user_data["username"], function_key)
     if not function:
         print("Function not found")
         raise HTTPException(status_code=404, detail="Function not found")
@@ -41,6 +36,10 @@ def evaluate_input_output_pair(input_data: EvaluationInput):
     if not version_data:
         raise HTTPException(status_code=404, detail="Version not found")
 
+    errors = call_schema_errors(function, input_payload, output_payload)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
     # Create a new call
     call_key = uuid.uuid4().hex
     call = {
@@ -55,20 +54,18 @@ def evaluate_input_output_pair(input_data: EvaluationInput):
 
     # Evaluate the output if not a custom function and tier allows it
     tier = user_data.get("tier", "free")
-    if function["type"] != "flow" and tier != "free":
-        metrics = version_data.get("metrics", [])
-        evaluation_scores = evaluate_output(
-            task, metrics, input_payload, output_payload
-        )
-        call["evaluation"] = evaluation_scores
-        call["status"] = "evaluated"
-    else:
-        call["status"] = "completed"
+    evaluate = function["type"] != "flow" and tier != "free"
+    call["status"] = "evaluating" if evaluate else "completed"
 
-    # Add call to version's calls
-    version_data["calls"].append(call)
+    # Append the call to the calls table
+    await put_call(function_key, version, call)
 
-    # Update function in user_data
-    save_user(user_data)
+    if not evaluate:
+        return {"message": "success"}
 
-    return {"message": "success"}
+    # Grade in the background; the evaluation is written to the call
+    job = submit_call_evaluation(
+        user_data["username"], {**function, "task": task}, version, call,
+        version_data.get("metrics", []),
+    )
+    return {"message": "success", "job_id": job.job_id}
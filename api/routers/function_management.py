@@ -1,27 +1,37 @@
 # api/routers/function_management.py
 
-from fastapi import APIRouter, HTTPException, Depends, Body
-from typing import Any
+from fastapi import APIRouter, HTTPException, Depends, Body, Request, Query
+from fastapi.responses import StreamingResponse
+from typing import Any, List, Optional
 from models import (
     FunctionSchema,
     UpdateParametersSchema,
     DeployVersionSchema,
     EnterpriseUpgradeRequest,
+    GenerateTestsRequest,
 )
-from utils import verify_token, get_user, save_user, get_max_tests, is_version_tree_enabled, dynamodb
+from VersionTree import add_version_updates, get_version_index, new_root_updates, version_ancestors, version_descendants, with_version_tree
+from utils import verify_token, get_user, get_max_tests, is_version_tree_enabled, save_enterprise_request, load_function_fields, parse_fields, load_functions, load_function, create_function_item, update_function, get_score_rollups, get_call_scores
 import uuid
 from datetime import datetime
 from decimal import Decimal
-from Evaluation import evaluate_function
-from config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+from jobs import evaluation_jobs, submit_test_set_evaluation
+from notifications import function_events
+from responses import negotiated_response
+from TestGeneration import stream_tests_from_schema
+from CompiledSchema import compile_schema
+from rollups import summarize_version
+from VersionComparison import compare_versions
+from export import export_calls_response
+import asyncio
+import json
+from config import TEST_GENERATION_MAX_TESTS, VERSION_WRITE_ATTEMPTS
 
 router = APIRouter()
 
-enterprise_table = dynamodb.Table("enterprise_requests")
-
 
 @router.post("/users/{username}/functions")
-def create_function(
+async def create_function(
     username: str,
     function: FunctionSchema,
     user_email: str = Depends(verify_token),
@@ -31,7 +41,7 @@ def create_function(
             status_code=403, detail="Cannot create functions for other users."
         )
 
-    user_data = get_user(username)
+    user_data = await get_user(username)
     tier = user_data.get("tier", "free")
 
     max_tests = get_max_tests(tier)
@@ -41,7 +51,18 @@ def create_function(
             detail=f"Test set exceeds the maximum allowed for tier {tier}. Max tests: {int(max_tests) if max_tests != float('inf') else 'Unlimited'}",
         )
 
-    functions = user_data.get("functions", [])
+    # Test inputs must match the input schema
+    if function.test_set and function.input_schema:
+        compiled = compile_schema(function.input_schema)
+        for i, test in enumerate(function.test_set):
+            errors = compiled.validate(test.get("input"))
+            if errors:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Test {i} does not match the input schema: " + "; ".join(errors),
+                )
+
+    functions = await load_functions(username, attributes=["name"])
 
     # Check if function name already exists
     if any(f["name"] == function.name for f in functions):
@@ -54,17 +75,14 @@ def create_function(
 
     if function.type == "flow":
         # Custom function logic
-        version_tree = {"name": versionId, "children": []}
         version_map = {
             versionId: {
                 "parameters": function.parameters or {},
-                "calls": [],
                 "date": datetime.now().isoformat(),
             }
         }
     else:
         # Chat completion function logic
-        version_tree = {"name": versionId, "children": []}
         version_map = {
             versionId: {
                 "parameters": {
@@ -72,7 +90,6 @@ def create_function(
                     "model": function.model,
                     "temperature": Decimal(str(function.temperature)),
                 },
-                "calls": [],
                 "date": datetime.now().isoformat(),
             }
         }
@@ -85,79 +102,242 @@ def create_function(
         "input_schema": function.input_schema,
         "output_schema": function.output_schema,
         "test_set": function.test_set or [],
-        "version_tree": version_tree,
+        **new_root_updates(versionId),
         "version_map": version_map,
         "function_key": function_key,
         "current_version": versionId,  # Set the current version
         "metrics": function.metrics or [],
     }
 
-    functions.append(new_function)
-    func_id = len(functions) - 1
+    func_id = len(functions)
 
-    # Update the user data
-    user_data["functions"] = functions
-    save_user(user_data)
+    # Store the function as its own item
+    if not await create_function_item(username, new_function):
+        raise HTTPException(status_code=409, detail="Function key collision, please retry")
 
-    # Evaluate the new version if tests exist
+    # Evaluate the new version in the background if tests exist
+    job_id = None
     tests = new_function.get("test_set", [])
     if tests and function.type != "flow":
-        eval_data = evaluate_function(new_function, versionId, tests, user_data["api_key"])
-        new_function["version_map"][versionId]["calls"].extend(eval_data)
-        # Update DynamoDB with evaluations
-        save_user(user_data)
+        job_id = submit_test_set_evaluation(username, new_function, versionId, tests).job_id
 
     return {
         "message": "Function created successfully",
         "functionId": func_id,
         "versionId": versionId,
         "function_key": function_key,
+        "evaluation_job": job_id,
     }
 
 
+@router.post("/users/{username}/generate_tests")
+async def generate_tests(
+    username: str,
+    data: GenerateTestsRequest,
+    user_email: str = Depends(verify_token),
+):
+    if username != user_email:
+        raise HTTPException(status_code=403, detail="Cannot generate tests for other users.")
+
+    user_data = await get_user(username)
+    # Unlimited tiers are still bounded by what one request may generate
+    max_tests = int(min(get_max_tests(user_data.get("tier", "free")), TEST_GENERATION_MAX_TESTS))
+    if data.num_tests < 1 or data.num_tests > max_tests:
+        raise HTTPException(
+            status_code=400,
+            detail=f"num_tests must be between 1 and {max_tests}",
+        )
+
+    # NDJSON: one {"input": ...} line per test as its chunk finishes, and an
+    # {"error": ..., "count": n} line for each chunk that could not be generated
+    async def lines():
+        async for chunk in stream_tests_from_schema(data.task, data.in_schema, data.num_tests):
+            if "error" in chunk:
+                yield json.dumps(chunk) + "\n"
+                continue
+            for test in chunk["tests"]:
+                yield json.dumps({"input": test}) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/users/{username}/function/{function_key}")
-def get_function(
-    username: str, function_key: str, user_email: str = Depends(verify_token)
+async def get_function(
+    username: str,
+    function_key: str,
+    request: Request,
+    fields: Optional[str] = None,
+    user_email: str = Depends(verify_token),
 ):
     if username != user_email:
         raise HTTPException(
             status_code=403, detail="Cannot access functions of other users."
         )
 
-    user_data = get_user(username)
-    functions = user_data.get("functions", [])
-    
-    # Find the function
-    function = next(
-        (f for f in functions if f.get("function_key") == function_key), None
-    )
+    # Find the function, limited to `fields`
+    function = await load_function_fields(username, function_key, parse_fields(fields))
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
     
     # print("function type", function["type"])
 
-    return {"function": function}
+    return negotiated_response(request, {"function": function})
+
+
+@router.get("/users/{username}/functions/{function_key}/summary")
+async def get_score_summary(
+    username: str,
+    function_key: str,
+    versions: Optional[str] = None,
+    user_email: str = Depends(verify_token),
+):
+    if username != user_email:
+        raise HTTPException(
+            status_code=403, detail="Cannot access functions of other users."
+        )
+
+    function = await load_function(
+        username, function_key, ["version_index", "root_version", "version_tree"]
+    )
+    if not function:
+        raise HTTPException(status_code=404, detail="Function not found")
+    index, _ = get_version_index(function)
+    selected = parse_fields(versions) or list(index)
+
+    # One small query per version, independent of how many calls it has
+    rollups = await asyncio.gather(
+        *(get_score_rollups(function_key, version) for version in selected)
+    )
+    return {
+        "versions": {
+            version: summarize_version(version_rollups)
+            for version, version_rollups in zip(selected, rollups)
+        }
+    }
+
+
+@router.get("/users/{username}/functions/{function_key}/compare")
+async def compare_function_versions(
+    username: str,
+    function_key: str,
+    versions: str,
+    baseline: Optional[str] = None,
+    resamples: int = 1000,
+    confidence: float = 0.95,
+    user_email: str = Depends(verify_token),
+):
+    if username != user_email:
+        raise HTTPException(
+            status_code=403, detail="Cannot access functions of other users."
+        )
+    if not 100 <= resamples <= 10000:
+        raise HTTPException(status_code=400, detail="resamples must be between 100 and 10000")
+    if not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+
+    function = await load_function(
+        username, function_key, ["version_index", "root_version", "version_tree"]
+    )
+    if not function:
+        raise HTTPException(status_code=404, detail="Function not found")
+    index, _ = get_version_index(function)
+    selected = list(dict.fromkeys(parse_fields(versions) or []))
+    if any(version not in index for version in selected):
+        raise HTTPException(status_code=404, detail="Version not found")
+    # A single version is compared against its parent
+    if len(selected) == 1 and not baseline:
+        baseline = index[selected[0]]["parent"]
+        if baseline is None:
+            raise HTTPException(status_code=400, detail="The root version has no parent to compare against")
+    baseline = baseline or selected[0]
+    if baseline not in index:
+        raise HTTPException(status_code=404, detail="Version not found")
+    if baseline not in selected:
+        selected.insert(0, baseline)
+    if len(selected) < 2:
+        raise HTTPException(status_code=400, detail="Select at least two versions to compare")
+
+    calls = await asyncio.gather(*(get_call_scores(function_key, version) for version in selected))
+    # CPU-bound; keep it off the event loop
+    return await asyncio.to_thread(
+        compare_versions, dict(zip(selected, calls)), baseline, resamples, confidence
+    )
+
+
+@router.get("/users/{username}/functions/{function_key}/export")
+async def export_function_calls(
+    username: str,
+    function_key: str,
+    format: str = "ndjson",
+    versions: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    user_email: str = Depends(verify_token),
+):
+    if username != user_email:
+        raise HTTPException(
+            status_code=403, detail="Cannot access functions of other users."
+        )
+
+    function = await load_function(
+        username, function_key, ["version_index", "root_version", "version_tree"]
+    )
+    if not function:
+        raise HTTPException(status_code=404, detail="Function not found")
+    index, _ = get_version_index(function)
+    selected = parse_fields(versions) or list(index)
+    if any(version not in index for version in selected):
+        raise HTTPException(status_code=404, detail="Version not found")
+    return export_calls_response(function_key, selected, format, status, since, until)
+
+
+@router.get("/users/{username}/functions/{function_key}/versions/{version}/lineage")
+async def get_version_lineage(
+    username: str,
+    function_key: str,
+    version: str,
+    user_email: str = Depends(verify_token),
+):
+    if username != user_email:
+        raise HTTPException(
+            status_code=403, detail="Cannot access functions of other users."
+        )
+
+    function = await load_function(
+        username, function_key, ["version_index", "root_version", "version_tree"]
+    )
+    if not function:
+        raise HTTPException(status_code=404, detail="Function not found")
+    index, root = get_version_index(function)
+    if version not in index:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    return {
+        "version": version,
+        "root_version": root,
+        "ancestors": version_ancestors(index, version),
+        "descendants": version_descendants(index, version),
+    }
 
 
 @router.post("/users/{username}/functions/{function_key}/update_parameters")
-def update_parameters(
+async def update_parameters(
     username: str,
     function_key: str,
     update: UpdateParametersSchema,
 ):
 
-    user_data = get_user(username)
-    functions = user_data.get("functions", [])
+    user_data = await get_user(username)
 
     # Find the function
-
-    function_index = next(
-        (i for i, f in enumerate(functions) if f.get("function_key") == function_key), None
-    )
-    if function_index is None:
+    function = await load_function(username, function_key)
+    if function is None:
         raise HTTPException(status_code=404, detail="Function not found")
-    
-    function = functions[function_index]
 
     tier = user_data.get("tier", "free")
 
@@ -167,20 +347,6 @@ def update_parameters(
         versionId = uuid.uuid4().hex
         # print("versionId", versionId)
 
-        def update_version_tree(node, name, new_node):
-            if node["name"] == name:
-                node["children"].append(new_node)
-                return
-            for child in node.get("children", []):
-                update_version_tree(child, name, new_node)
-
-        # Create new version node
-        new_version_node = {"name": versionId, "children": []}
-
-        # add version to children of current version node
-        update_version_tree(function["version_tree"], update.version, new_version_node)
-        
-
         # Create new version data
         for key, value in update.new_parameters.items():
             if type(value) == float:
@@ -188,26 +354,42 @@ def update_parameters(
         
         version_data = {
             "parameters": update.new_parameters or {},
-            "calls": [],
             "date": datetime.now().isoformat(),
         }
 
-        function["version_map"][versionId] = version_data
+        # Write only the new version and its index entries, under the version
+        # it was made from. A rejected write is retried on a fresh read, in
+        # case another update indexed a legacy function first.
+        for _ in range(VERSION_WRITE_ATTEMPTS):
+            tree_updates = add_version_updates(function, update.version, versionId)
+            if tree_updates is None:
+                raise HTTPException(status_code=404, detail="Version not found")
+            tree_updates["updates"][("version_map", versionId)] = version_data
+            if await update_function(
+                username,
+                function_key,
+                must_exist=[("version_map", update.version)],
+                **tree_updates,
+            ):
+                break
+            function = await load_function(username, function_key, consistent=True)
+            if function is None:
+                raise HTTPException(status_code=404, detail="Function not found")
+        else:
+            raise HTTPException(status_code=409, detail="Function is being updated, try again")
 
+        function["version_map"][versionId] = version_data
 
-        # Evaluate the new version if tests exist
+        # Evaluate the new version in the background if tests exist
+        job_id = None
         tests = function.get("test_set", [])
         if tests and function["type"] != "flow":
-            eval_data = evaluate_function(
-                function, versionId, tests, user_data["api_key"]
-            )
-            function["version_map"][versionId]["calls"].extend(eval_data)
-            # Update DynamoDB with evaluations
-            
-        save_user(user_data)
+            job_id = submit_test_set_evaluation(username, function, versionId, tests).job_id
+
         return {
             "message": "Parameters updated, new version created successfully",
             "version": versionId,
+            "evaluation_job": job_id,
         }
     else:
         # free tier: Update the existing version directly
@@ -217,85 +399,97 @@ def update_parameters(
             raise HTTPException(status_code=404, detail="Version not found")
 
         if function["type"] == "flow":
-            version_data["parameters"] = update.new_parameters or version_data.get("parameters", {})
+            updates = {
+                ("version_map", versionId, "parameters"): update.new_parameters
+                or version_data.get("parameters", {}),
+            }
         else:
-            version_data["prompt"] = update.new_prompt or version_data.get("prompt")
-            version_data["model"] = update.new_model or version_data.get("model")
-            version_data["temperature"] = update.new_temperature if update.new_temperature else version_data.get("temperature")
-
-            # Evaluate the updated version if tests exist
-            tests = function.get("test_set", [])
-            if tests:
-                eval_data = evaluate_function(
-                    function, versionId, tests, user_data["api_key"]
-                )
-                version_data["calls"] = eval_data
+            updates = {
+                ("version_map", versionId, "prompt"): update.new_prompt or version_data.get("prompt"),
+                ("version_map", versionId, "model"): update.new_model or version_data.get("model"),
+                ("version_map", versionId, "temperature"): update.new_temperature
+                if update.new_temperature
+                else version_data.get("temperature"),
+            }
+            version_data.update({path[-1]: value for path, value in updates.items()})
+
+        # Update only the changed attributes of this version
+        updated = await update_function(
+            username, function_key, updates, must_exist=[("version_map", versionId)]
+        )
+        if not updated:
+            raise HTTPException(status_code=404, detail="Version not found")
+        function_events.publish(username, function_key)
 
-        # Update DynamoDB
-        save_user(user_data)
+        # Re-evaluate the updated version in the background if tests exist
+        job_id = None
+        tests = function.get("test_set", [])
+        if tests and function["type"] != "flow":
+            job_id = submit_test_set_evaluation(username, function, versionId, tests).job_id
 
-        return {"message": "Function parameters updated successfully"}
+        return {"message": "Function parameters updated successfully", "evaluation_job": job_id}
 
 
 @router.post("/users/{username}/functions/{function_key}/deploy_version")
-def deploy_version(
+async def deploy_version(
     username: str,
     function_key: str,
     version_data: DeployVersionSchema
     ):
     version = version_data.version
-    user_data = get_user(username)
-    functions = user_data.get("functions", [])
-
-    # Find the function
 
-    function = next(
-        (f for f in functions if f.get("function_key") == function_key), None
+    # Set the function's current_version, provided the version exists
+    updated = await update_function(
+        username,
+        function_key,
+        {("current_version",): version},
+        must_exist=[("version_map", version)],
     )
-    if not function:
-        raise HTTPException(status_code=404, detail="Function not found")
+    if not updated:
+        raise HTTPException(status_code=404, detail="Version not found")
+    function_events.publish(username, function_key)
 
-    tier = user_data.get("tier", "free")
+    return {"message": f"Version {version} deployed successfully"}
 
-    # Navigate to the version node to ensure it exists
-    def find_version_node(node, name):
-        if node["name"] == name:
-            return node
-        for child in node.get("children", []):
-            result = find_version_node(child, name)
-            if result:
-                return result
-        return None
-
-    version_node = find_version_node(function["version_tree"], version)
-    if not version_node:
-        raise HTTPException(status_code=404, detail="Version not found")
 
-    # Set the function's current_version to the specified version
-    function["current_version"] = version
+@router.get("/users/{username}/jobs")
+async def list_jobs(username: str, user_email: str = Depends(verify_token)):
+    if username != user_email:
+        raise HTTPException(status_code=403, detail="Cannot access jobs of other users.")
+    return {"jobs": [job.to_dict() for job in evaluation_jobs.list(username)]}
 
-    # Update DynamoDB
-    save_user(user_data)
 
-    return {"message": f"Version {version} deployed successfully"}
+@router.get("/users/{username}/jobs/{job_id}")
+async def get_job(username: str, job_id: str, user_email: str = Depends(verify_token)):
+    if username != user_email:
+        raise HTTPException(status_code=403, detail="Cannot access jobs of other users.")
+    job = evaluation_jobs.get(job_id, username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 
 @router.get("/users/{username}")
-def get_user_data(username: str, user_email: str = Depends(verify_token)):
+async def get_user_data(
+    username: str, request: Request, user_email: str = Depends(verify_token)
+):
     if username != user_email:
         raise HTTPException(
             status_code=403, detail="Cannot access data of other users."
         )
-    user_data = get_user(username)
-    return user_data
+    user_data = await get_user(username)
+    user_data["functions"] = [
+        with_version_tree(function) for function in await load_functions(username)
+    ]
+    return negotiated_response(request, user_data)
 
 
 @router.post("/upgrade-enterprise")
-def upgrade_enterprise(request: EnterpriseUpgradeRequest):
+async def upgrade_enterprise(request: EnterpriseUpgradeRequest):
     # Handle the enterprise upgrade request
     try:
-        enterprise_table.put_item(
-            Item={
+        await save_enterprise_request(
+            {
                 "request_id": uuid.uuid4().hex,
                 "email": request.email,
                 "message": request.message,
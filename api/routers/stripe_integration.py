@@ -71,12 +71,12 @@ async def stripe_webhook(request: Request):
     # Handle the checkout.session.completed event
     if event["type"] == "checkout.session.completed":
         session_obj = event["data"]["object"]
-        handle_checkout_session(session_obj)
+        await handle_checkout_session(session_obj)
 
     return JSONResponse(status_code=200, content={"detail": "Webhook received"})
 
 
-def handle_checkout_session(session_obj):
+async def handle_checkout_session(session_obj):
     # Retrieve the metadata to get the username and tier
     username = session_obj.get("metadata", {}).get("username")
     tier = session_obj.get("metadata", {}).get("tier")
@@ -87,9 +87,9 @@ def handle_checkout_session(session_obj):
 
     try:
         # Update the user's tier in DynamoDB
-        user_data = get_user(username)
+        user_data = await get_user(username)
         user_data["tier"] = tier
-        save_user(user_data)
+        await save_user(user_data)
         print(f"User {username} upgraded to {tier}.")
     except Exception as e:
         print(f"Error updating user tier: {str(e)}")
@@ -0,0 +1,90 @@
+# API key resolution cost as the number of users grows, against an
+# in-memory key table. Run with -s to see the table:
+#   python -m pytest -s tests/test_api_key_lookup_benchmark.py
+
+import asyncio
+import secrets
+import time
+
+import pytest
+
+utils = pytest.importorskip("utils")
+
+USER_COUNTS = (100, 1_000, 10_000, 100_000)
+LOOKUPS = 2_000
+
+
+class FakeKeyTable:
+    """get_item on a dict, counting the items each call reads."""
+
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+        self.items_read = 0
+
+    async def get_item(self, Key):
+        self.calls += 1
+        item = self.items.get(Key["api_key"])
+        if item is None:
+            return {}
+        self.items_read += 1
+        return {"Item": item}
+
+
+def key_table(users):
+    keys = [secrets.token_hex(16) for _ in range(users)]
+    return keys, FakeKeyTable({key: {"api_key": key, "username": f"user{i}"} for i, key in enumerate(keys)})
+
+
+async def resolve(keys):
+    started = time.perf_counter()
+    for key in keys:
+        assert await utils.find_username_by_api_key(key)
+    return (time.perf_counter() - started) / len(keys)
+
+
+def measure(users, monkeypatch):
+    keys, table = key_table(users)
+    monkeypatch.setattr(utils, "api_key_table", table, raising=False)
+    # Cold: each key misses the cache once; warm: the same keys again
+    sample = keys[:: max(1, users // LOOKUPS)][:LOOKUPS]
+    utils.api_key_cache.clear()
+    monkeypatch.setattr(utils.api_key_cache, "maxsize", LOOKUPS)
+    cold = asyncio.run(resolve(sample))
+    cold_reads = table.items_read
+    warm = asyncio.run(resolve(sample))
+    return {
+        "users": users,
+        "cold_us": cold * 1e6,
+        "warm_us": warm * 1e6,
+        "reads_per_miss": cold_reads / len(sample),
+        "storage_calls": table.calls,
+        "lookups": len(sample),
+    }
+
+
+def test_key_resolution_stays_flat_as_users_grow(monkeypatch):
+    # Discarded: the first run pays for event loop and import warm-up
+    measure(USER_COUNTS[0], monkeypatch)
+    rows = [measure(users, monkeypatch) for users in USER_COUNTS]
+    print()
+    print(f"{'users':>8}{'cold us':>10}{'warm us':>10}{'reads/miss':>12}")
+    for row in rows:
+        print(f"{row['users']:>8}{row['cold_us']:>10.2f}{row['warm_us']:>10.2f}{row['reads_per_miss']:>12.1f}")
+
+    for row in rows:
+        # One item read per distinct key, whatever the table size, and none
+        # once the key is cached
+        assert row["reads_per_miss"] == 1
+        assert row["storage_calls"] == row["lookups"]
+    # Latency doesn't grow with the user count (generous bound for noisy runners)
+    assert rows[-1]["cold_us"] < rows[0]["cold_us"] * 5 + 50
+    assert rows[-1]["warm_us"] < rows[0]["warm_us"] * 5 + 50
+
+
+def test_unknown_key_costs_one_read(monkeypatch):
+    keys, table = key_table(10)
+    monkeypatch.setattr(utils, "api_key_table", table, raising=False)
+    utils.api_key_cache.clear()
+    assert asyncio.run(utils.find_username_by_api_key("not-a-key")) is None
+    assert table.calls == 1
@@ -0,0 +1,101 @@
+import os
+from decimal import Decimal
+
+import pytest
+
+import archive
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "CALL_ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(archive, "CALL_ARCHIVE_BLOCK_CALLS", 3)
+    archive.segment_index_cache.clear()
+    return tmp_path
+
+
+def make_call(i, status="evaluated"):
+    return {
+        "call_key": f"call-{i:03d}",
+        "timestamp": f"2024-01-01T00:00:{i:02d}",
+        "status": status,
+        "inputs": {"x": Decimal("1.5"), "n": Decimal(i)},
+        "evaluation": {"scores": {"accuracy": Decimal(90)}},
+    }
+
+
+def keys(calls):
+    return [call["call_key"] for call in calls]
+
+
+def test_segment_round_trip():
+    calls = [make_call(i) for i in range(10)]
+    archive.write_segment("fn", "v1", list(reversed(calls)))
+
+    segments = archive.load_segments("fn", "v1")
+    assert len(segments) == 1
+    assert [block["count"] for block in segments[0].blocks] == [3, 3, 3, 1]
+    stored = list(archive.iter_archived_calls("fn", "v1"))
+    assert keys(stored) == keys(reversed(calls))
+    assert stored[-1]["inputs"] == {"x": 1.5, "n": 0}
+    assert stored[-1]["evaluation"] == {"scores": {"accuracy": 90}}
+    assert archive.archived_call_keys("fn", "v1") == set(keys(calls))
+
+
+def test_incomplete_segment_is_ignored():
+    archive.write_segment("fn", "v1", [make_call(0)])
+    # A data file whose index was never written
+    with open(os.path.join(archive.partition_dir("fn", "v1"), "000002.jsonl.gz"), "wb") as f:
+        f.write(b"partial")
+    assert keys(archive.iter_archived_calls("fn", "v1")) == ["call-000"]
+
+
+def test_paging_newest_first_across_segments():
+    archive.write_segment("fn", "v1", [make_call(i) for i in range(0, 12, 2)])
+    archive.write_segment("fn", "v1", [make_call(i) for i in range(1, 12, 2)])
+
+    pages = []
+    before = None
+    while True:
+        page, more = archive.read_archived_calls("fn", "v1", 5, before)
+        pages.append(keys(page))
+        if not more:
+            break
+        before = f"{page[-1]['timestamp']}#{page[-1]['call_key']}"
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert sum(pages, []) == [f"call-{i:03d}" for i in range(11, -1, -1)]
+
+
+def test_before_excludes_the_cursor_call():
+    archive.write_segment("fn", "v1", [make_call(i) for i in range(6)])
+    page, more = archive.read_archived_calls("fn", "v1", 10, "2024-01-01T00:00:03#call-003")
+    assert keys(page) == ["call-002", "call-001", "call-000"]
+    assert not more
+
+
+def test_status_filter():
+    archive.write_segment(
+        "fn", "v1", [make_call(i, "failed" if i % 3 == 0 else "evaluated") for i in range(9)]
+    )
+    page, more = archive.read_archived_calls("fn", "v1", 10, statuses=["failed"])
+    assert keys(page) == ["call-006", "call-003", "call-000"]
+    assert not more
+
+
+def test_versions_are_separate():
+    archive.write_segment("fn", "v1", [make_call(0)])
+    assert list(archive.iter_archived_calls("fn", "v2")) == []
+    assert archive.archived_call_count("fn", "v2") == 0
+
+
+def test_rerun_archives_each_call_once():
+    calls = [make_call(i) for i in range(5)]
+    assert archive.archive_new_calls("fn", "v1", calls[:3]) == 3
+    # A compaction that stopped before deleting sees the same calls again
+    assert archive.archive_new_calls("fn", "v1", calls) == 2
+    assert archive.archive_new_calls("fn", "v1", calls) == 0
+
+    assert len(archive.load_segments("fn", "v1")) == 2
+    assert archive.archived_call_count("fn", "v1") == 5
+    assert keys(archive.iter_archived_calls("fn", "v1")) == keys(reversed(calls))
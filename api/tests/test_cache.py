@@ -0,0 +1,32 @@
+from cache import LRUCache
+
+
+def test_fill_is_dropped_if_key_popped_during_read():
+    cache = LRUCache(4)
+    generation = cache.generation("fn")
+    cache.pop("fn")
+    cache.set("fn", "stale", generation)
+    assert cache.get("fn") is None
+
+    generation = cache.generation("fn")
+    cache.set("fn", "fresh", generation)
+    assert cache.get("fn") == "fresh"
+
+
+def test_other_keys_do_not_block_fills():
+    cache = LRUCache(4)
+    generation = cache.generation("fn")
+    cache.pop("other")
+    cache.set("fn", "value", generation)
+    assert cache.get("fn") == "value"
+
+
+def test_forgotten_generations_never_match_a_popped_key():
+    cache = LRUCache(2)
+    generation = cache.generation("fn")
+    cache.pop("fn")
+    # Push the pop of "fn" out of the bounded generation table
+    for key in ("a", "b", "c"):
+        cache.pop(key)
+    cache.set("fn", "stale", generation)
+    assert cache.get("fn") is None
@@ -0,0 +1,197 @@
+import asyncio
+
+from job_queue import JobQueue
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def wait_for_status(job, *statuses):
+    while job.status not in statuses:
+        await asyncio.sleep(0)
+
+
+def test_steps_run_round_robin_across_tenants():
+    async def main():
+        order = []
+
+        def step(name):
+            async def run_step():
+                order.append(name)
+            return run_step
+
+        queue = JobQueue(concurrency=1, retention=10)
+        big = queue.submit("alice", "test", [step(f"a{i}") for i in range(4)])
+        small = queue.submit("bob", "test", [step(f"b{i}") for i in range(2)])
+        queue.start()
+        await wait_for_status(big, "succeeded")
+        await wait_for_status(small, "succeeded")
+        await queue.stop()
+        return order
+
+    # bob's job is interleaved with alice's instead of waiting behind it
+    assert run(main()) == ["a0", "b0", "a1", "b1", "a2", "a3"]
+
+
+def test_finish_gets_results_in_step_order():
+    async def main():
+        def step(i, delay):
+            async def run_step():
+                await asyncio.sleep(delay)
+                return i
+            return run_step
+
+        async def finish(results):
+            return sum(results), results
+
+        queue = JobQueue(concurrency=3, retention=10)
+        job = queue.submit("alice", "test", [step(0, 0.03), step(1, 0.01), step(2, 0.02)], finish)
+        queue.start()
+        await wait_for_status(job, "succeeded")
+        await queue.stop()
+        return job
+
+    job = run(main())
+    assert job.result == (3, [0, 1, 2])
+    assert job.to_dict()["progress"] == {"done": 3, "total": 3}
+
+
+def test_max_concurrency_caps_running_steps():
+    async def main():
+        running = peak = 0
+
+        async def step():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        queue = JobQueue(concurrency=8, retention=10)
+        job = queue.submit("alice", "test", [step for _ in range(10)], max_concurrency=2)
+        queue.start()
+        await wait_for_status(job, "succeeded")
+        await queue.stop()
+        return peak
+
+    assert run(main()) == 2
+
+
+def test_capped_job_does_not_hold_back_other_tenants():
+    async def main():
+        release = asyncio.Event()
+        done = []
+
+        async def slow():
+            await release.wait()
+
+        async def fast():
+            done.append("bob")
+
+        queue = JobQueue(concurrency=4, retention=10)
+        capped = queue.submit("alice", "test", [slow for _ in range(5)], max_concurrency=1)
+        other = queue.submit("bob", "test", [fast])
+        queue.start()
+        await wait_for_status(other, "succeeded")
+        release.set()
+        await wait_for_status(capped, "succeeded")
+        await queue.stop()
+        return done
+
+    assert run(main()) == ["bob"]
+
+
+def test_on_failure_runs_once_and_remaining_steps_are_skipped():
+    async def main():
+        failures = []
+        ran = []
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def step():
+            ran.append(1)
+
+        async def on_failure(error):
+            failures.append(error)
+
+        queue = JobQueue(concurrency=1, retention=10)
+        job = queue.submit("alice", "test", [fail, step, step], on_failure=on_failure)
+        queue.start()
+        await wait_for_status(job, "failed")
+        await asyncio.sleep(0.01)
+        await queue.stop()
+        return job, failures, ran
+
+    job, failures, ran = run(main())
+    assert failures == ["boom"]
+    assert ran == []
+    assert job.error == "boom"
+
+
+def test_failing_finish_fails_the_job():
+    async def main():
+        failures = []
+
+        async def step():
+            return 1
+
+        async def finish(results):
+            raise RuntimeError("store failed")
+
+        async def on_failure(error):
+            failures.append(error)
+
+        queue = JobQueue(concurrency=1, retention=10)
+        job = queue.submit("alice", "test", [step], finish, on_failure=on_failure)
+        queue.start()
+        await wait_for_status(job, "failed")
+        await queue.stop()
+        return job, failures
+
+    job, failures = run(main())
+    assert job.status == "failed"
+    assert failures == ["store failed"]
+
+
+def test_jobs_are_private_and_retention_is_bounded():
+    async def main():
+        queue = JobQueue(concurrency=1, retention=2)
+        jobs = [queue.submit("alice", "test", []) for _ in range(3)]
+        queue.start()
+        await wait_for_status(jobs[-1], "succeeded")
+        await queue.stop()
+        return queue, jobs
+
+    queue, jobs = run(main())
+    assert queue.get(jobs[2].job_id, "bob") is None
+    assert queue.get(jobs[2].job_id, "alice") is jobs[2]
+    # Only the last `retention` finished jobs are kept
+    assert queue.get(jobs[0].job_id, "alice") is None
+
+
+def test_stop_fails_unfinished_jobs():
+    async def main():
+        failures = []
+        started = asyncio.Event()
+
+        async def step():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def on_failure(error):
+            failures.append(error)
+
+        queue = JobQueue(concurrency=1, retention=10)
+        running = queue.submit("alice", "test", [step], on_failure=on_failure)
+        queued = queue.submit("alice", "test", [step], on_failure=on_failure)
+        queue.start()
+        await started.wait()
+        await queue.stop()
+        return queue, running, queued, failures
+
+    queue, running, queued, failures = run(main())
+    assert running.status == queued.status == "failed"
+    assert len(failures) == 2
+    assert queue.stats()["queued_steps"] == 0
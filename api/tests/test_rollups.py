@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from rollups import merge_rollups, score_deltas, summarize, summarize_version
+
+
+def evaluation(**scores):
+    return {"analysis": "", "scores": scores}
+
+
+def apply(rollup, deltas):
+    # What DynamoDB ADD does to the stored rollup
+    for field, amount in deltas.items():
+        rollup[field] = rollup.get(field, 0) + amount
+    return rollup
+
+
+def test_replacing_with_the_same_score_is_a_no_op():
+    same = evaluation(accuracy=80)
+    assert score_deltas([same], [same]) == {"accuracy": {}}
+
+
+def test_replacing_a_score_moves_it_between_buckets():
+    deltas = score_deltas([evaluation(accuracy=90)], [evaluation(accuracy=Decimal(80))])
+    assert deltas == {"accuracy": {"sum": 10, "sumsq": 1700, "b90": 1, "b80": -1}}
+
+    rollup = apply({}, score_deltas([evaluation(accuracy=80), evaluation(accuracy=70)])["accuracy"])
+    rollup = apply(rollup, deltas["accuracy"])
+    assert summarize(rollup)["count"] == 2
+    assert summarize(rollup)["mean"] == 80
+    assert (summarize(rollup)["min"], summarize(rollup)["max"]) == (70, 90)
+
+
+def test_non_numeric_scores_are_ignored():
+    deltas = score_deltas([evaluation(accuracy=True, tone="good", concision=50), None, {}])
+    assert list(deltas) == ["concision"]
+
+
+def test_out_of_range_scores_are_clamped_to_the_end_buckets():
+    deltas = score_deltas([evaluation(a=-3), evaluation(a=140)])["a"]
+    assert deltas["b0"] == deltas["b100"] == 1
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_quantiles_match_numpy(seed):
+    scores = np.random.default_rng(seed).integers(0, 101, size=997)
+    rollup = apply({}, score_deltas([evaluation(m=int(s)) for s in scores])["m"])
+    summary = summarize(rollup)
+    for name, q in (("p50", 50), ("p90", 90), ("p99", 99)):
+        assert summary[name] == np.percentile(scores, q, method="inverted_cdf")
+    assert summary["mean"] == pytest.approx(scores.mean())
+    assert summary["stddev"] == pytest.approx(scores.std())
+    assert (summary["min"], summary["max"]) == (scores.min(), scores.max())
+
+
+def test_empty_rollups():
+    assert summarize({}) == {"count": 0}
+    # Every score was replaced away
+    rollup = apply({}, score_deltas([evaluation(m=60)])["m"])
+    rollup = apply(rollup, score_deltas([], [evaluation(m=60)])["m"])
+    assert summarize(rollup) == {"count": 0}
+    assert summarize_version({}) == {"metrics": {}, "overall": {"count": 0}}
+
+
+def test_overall_pools_every_metric():
+    rollups = {
+        "accuracy": apply({"metric": "accuracy"}, score_deltas([evaluation(accuracy=90)])["accuracy"]),
+        "tone": apply({"metric": "tone"}, score_deltas([evaluation(tone=70), evaluation(tone=80)])["tone"]),
+    }
+    # Non-counter attributes of the stored items are not summed
+    assert "metric" not in merge_rollups(rollups.values())
+    summary = summarize_version(rollups)
+    assert summary["metrics"]["tone"]["mean"] == 75
+    assert summary["overall"]["count"] == 3
+    assert summary["overall"]["mean"] == 80
+    assert summary["overall"]["p50"] == 80
@@ -0,0 +1,69 @@
+import importlib.util
+import os
+from decimal import Decimal
+
+import pytest
+
+import CompiledSchema
+
+# The SDK's copy, loaded from its file so the SDK package (and its OpenAI
+# client) isn't imported
+SDK_SCHEMA = os.path.join(
+    os.path.dirname(__file__), "..", "..", "library", "aetherllm", "AetherSchema.py"
+)
+spec = importlib.util.spec_from_file_location("AetherSchema", SDK_SCHEMA)
+AetherSchema = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(AetherSchema)
+
+SCHEMAS = [
+    {"type": "string"},
+    {
+        "type": "object",
+        "title": "Review",
+        "properties": {
+            "text": {"type": "string", "desiredProperties": ["concise"]},
+            "rating": {"type": "integer", "minimum": Decimal(1), "maximum": Decimal(5)},
+        },
+    },
+    {
+        "type": "object",
+        "properties": {
+            "tags": {"type": "array", "items": {"type": "object", "properties": {"name": {"type": "string"}}}},
+            "score": {"type": "number", "metrics": ["accuracy"]},
+        },
+        "required": ["tags"],
+    },
+]
+
+VALUES = [
+    "text",
+    {"text": "ok", "rating": 3},
+    {"text": "ok", "rating": 9},
+    {"tags": [{"name": "a"}]},
+    {"tags": "a", "score": 1.5},
+]
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+def test_server_and_sdk_clean_schemas_identically(schema):
+    server = CompiledSchema.compile_schema(schema)
+    sdk = AetherSchema.compile_schema(schema)
+    assert server.hash == sdk.hash
+    assert server.cleaned == sdk.cleaned
+    assert server.openai_definition("output") == sdk.openai_definition("output")
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+def test_server_and_sdk_agree_on_validity(schema):
+    server = CompiledSchema.compile_schema(schema)
+    sdk = AetherSchema.compile_schema(schema)
+    for value in VALUES:
+        assert bool(server.validate(value)) == bool(sdk.validate(value))
+
+
+def test_cleaning_makes_objects_strict():
+    cleaned = CompiledSchema.clean_schema(SCHEMAS[1])
+    assert "title" not in cleaned
+    assert cleaned["required"] == ["text", "rating"]
+    assert cleaned["additionalProperties"] is False
+    assert "desiredProperties" not in cleaned["properties"]["text"]
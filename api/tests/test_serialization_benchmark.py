@@ -0,0 +1,119 @@
+# Serialization time and bytes on the wire for a large function document,
+# per representation negotiated_response can send. Run with -s to see the
+# table: python -m pytest -s tests/test_serialization_benchmark.py
+
+import gzip
+import time
+from decimal import Decimal
+
+import orjson
+import pytest
+
+pytest.importorskip("fastapi")
+from starlette.requests import Request
+
+import responses
+
+ACCEPTS = {"json": "application/json", "msgpack": "application/msgpack, application/json"}
+ENCODINGS = ("identity", "gzip", "zstd")
+
+
+def large_function(versions=300, tests=200):
+    # Shaped like a function item read from DynamoDB: numbers are Decimals
+    return {
+        "function_key": "f" * 32,
+        "name": "Summarize support ticket",
+        "task": "Summarize the ticket and classify its urgency. " * 5,
+        "type": "llm",
+        "revision": Decimal(412),
+        "current_version": "v0",
+        "metrics": ["accuracy", "concision", "tone"],
+        "input_schema": {"type": "object", "properties": {"ticket": {"type": "string"}}},
+        "output_schema": {
+            "type": "object",
+            "properties": {"summary": {"type": "string"}, "urgency": {"type": "integer"}},
+        },
+        "version_map": {
+            f"v{i}": {
+                "parameters": {
+                    "model": "gpt-4o-mini",
+                    "temperature": Decimal("0.7"),
+                    "prompt": f"You are a support assistant, revision {i}. " * 8,
+                },
+                "date": f"2024-03-{i % 28 + 1:02d}T12:00:00",
+                "metrics": ["accuracy", "concision", "tone"],
+                "scores": {"accuracy": Decimal(80 + i % 20), "concision": Decimal("71.5")},
+            }
+            for i in range(versions)
+        },
+        "version_index": {
+            f"v{i}": {"parent": f"v{(i - 1) // 2}" if i else None, "children": []}
+            for i in range(versions)
+        },
+        "test_set": [
+            {"input": {"ticket": f"Ticket {i}: the export has been failing since Monday."}}
+            for i in range(tests)
+        ],
+    }
+
+
+def make_request(representation, encoding):
+    headers = [(b"accept", ACCEPTS[representation].encode())]
+    if encoding != "identity":
+        headers.append((b"accept-encoding", encoding.encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def decode(response):
+    body = response.body
+    encoding = response.headers.get("content-encoding")
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "zstd":
+        body = responses.zstandard.ZstdDecompressor().decompress(body)
+    if response.media_type == responses.MSGPACK_MEDIA_TYPE:
+        return responses.msgpack.unpackb(body)
+    return orjson.loads(body)
+
+
+def measure(content, representation, encoding, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response = responses.negotiated_response(make_request(representation, encoding), content)
+    return response, (time.perf_counter() - started) / repeat
+
+
+def run_benchmark(content):
+    rows = []
+    for representation in ACCEPTS:
+        if representation == "msgpack" and responses.msgpack is None:
+            continue
+        for encoding in ENCODINGS:
+            if encoding == "zstd" and responses.zstandard is None:
+                continue
+            response, seconds = measure(content, representation, encoding)
+            rows.append((representation, encoding, response, seconds))
+    return rows
+
+
+def test_representations_round_trip_and_shrink():
+    content = large_function()
+    rows = run_benchmark(content)
+    expected = orjson.loads(orjson.dumps(content, default=responses._default))
+    sizes = {}
+    for representation, encoding, response, seconds in rows:
+        assert decode(response) == expected
+        sizes[representation, encoding] = len(response.body)
+    assert sizes["json", "gzip"] < sizes["json", "identity"] / 3
+    if ("msgpack", "identity") in sizes:
+        assert sizes["msgpack", "identity"] < sizes["json", "identity"]
+    if ("json", "zstd") in sizes:
+        assert sizes["json", "zstd"] < sizes["json", "identity"] / 3
+    print_table(rows)
+
+
+def print_table(rows):
+    print()
+    print(f"{'representation':<16}{'encoding':<10}{'bytes':>10}{'ms':>10}")
+    for representation, encoding, response, seconds in rows:
+        print(f"{representation:<16}{encoding:<10}{len(response.body):>10}{seconds * 1000:>10.2f}")
@@ -0,0 +1,33 @@
+from VersionTree import add_version_updates, build_version_tree, get_version_index
+
+LEGACY = {"version_tree": {"name": "root", "children": [{"name": "a", "children": []}]}}
+INDEXED = {
+    "version_index": {"root": {"parent": None, "children": ["a"]}, "a": {"parent": "root", "children": []}},
+    "root_version": "root",
+}
+
+
+def test_indexed_function_gets_targeted_writes():
+    kwargs = add_version_updates(INDEXED, "a", "b")
+    assert kwargs == {
+        "updates": {("version_index", "b"): {"parent": "a", "children": []}},
+        "appends": {("version_index", "a", "children"): ["b"]},
+    }
+
+
+def test_legacy_function_is_indexed_once_and_tree_removed():
+    kwargs = add_version_updates(LEGACY, "a", "b")
+    index = kwargs["updates"][("version_index",)]
+    assert kwargs["updates"][("root_version",)] == "root"
+    # Only applies if no concurrent update indexed the function first
+    assert kwargs["must_not_exist"] == [("version_index",)]
+    assert kwargs["removes"] == [("version_tree",)]
+    assert build_version_tree(index, "root") == {
+        "name": "root",
+        "children": [{"name": "a", "children": [{"name": "b", "children": []}]}],
+    }
+
+
+def test_missing_parent():
+    assert add_version_updates(LEGACY, "missing", "b") is None
+    assert get_version_index(INDEXED) == (INDEXED["version_index"], "root")
@@ -0,0 +1,89 @@
+# api/unit_of_work.py
+
+import asyncio
+from fastapi import HTTPException, Request
+from typing import Any, Dict, Optional
+from utils import (
+    find_username_by_api_key,
+    get_user,
+    load_function,
+    find_call,
+    update_call_fields,
+)
+
+
+class UnitOfWork:
+    """Request-scoped view of one tenant's storage.
+
+    The tenant, its functions and calls are each loaded at most once per
+    request. Call writes are buffered as dirty attributes and flushed by
+    commit(), which issues a single UpdateItem per touched call. Functions
+    are written directly with utils.update_function.
+    """
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self._username = None
+        self._user = None
+        self._functions: Dict[str, Dict[str, Any]] = {}
+        self._calls: Dict[str, Dict[str, Any]] = {}
+        self._call_updates: Dict[str, Dict[str, Any]] = {}
+
+    async def username(self) -> str:
+        if self._username is None:
+            if not self.api_key:
+                raise HTTPException(status_code=401, detail="API key required")
+            self._username = await find_username_by_api_key(self.api_key)
+            if not self._username:
+                raise HTTPException(status_code=401, detail="Invalid API key")
+        return self._username
+
+    async def user(self) -> Dict[str, Any]:
+        if self._user is None:
+            self._user = await get_user(await self.username())
+            if not self._user:
+                raise HTTPException(status_code=401, detail="Invalid API key")
+        return self._user
+
+    async def function(self, function_key: str) -> Dict[str, Any]:
+        if function_key not in self._functions:
+            function = await load_function(await self.username(), function_key)
+            if not function:
+                raise HTTPException(status_code=404, detail="Function not found")
+            self._functions[function_key] = function
+        return self._functions[function_key]
+
+    async def call(
+        self,
+        call_key: str,
+        function_key: str = None,
+        version: str = None,
+        timestamp: str = None,
+    ) -> Dict[str, Any]:
+        if call_key not in self._calls:
+            call = await find_call(call_key, function_key, version, timestamp)
+            if not call:
+                raise HTTPException(status_code=404, detail="Call not found")
+            # The call must belong to one of this tenant's functions
+            await self.function(call["function_key"])
+            self._calls[call_key] = call
+        return self._calls[call_key]
+
+    def update_call(self, call_key: str, fields: Dict[str, Any]):
+        fields = {k: v for k, v in fields.items() if v is not None}
+        self._calls[call_key].update(fields)
+        self._call_updates.setdefault(call_key, {}).update(fields)
+
+    async def commit(self):
+        writes = [
+            update_call_fields(self._calls[call_key], fields)
+            for call_key, fields in self._call_updates.items()
+        ]
+        self._call_updates.clear()
+        results = await asyncio.gather(*writes)
+        if not all(results):
+            raise HTTPException(status_code=404, detail="Item not found")
+
+
+def get_unit_of_work(request: Request) -> UnitOfWork:
+    return UnitOfWork(request.headers.get("X-API-Key"))
@@ -4,22 +4,118 @@ from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
-import boto3
-from boto3.dynamodb.conditions import Attr
+import aioboto3
+import asyncio
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+from contextlib import AsyncExitStack
+from contextvars import ContextVar
+import base64
+import copy
+import itertools
+import json
 import os
 import secrets
-from config import GOOGLE_CLIENT_ID, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
-from typing import Any, Dict
+import time
+from decimal import Decimal
+from config import (
+    GOOGLE_CLIENT_ID,
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    AWS_REGION,
+    API_KEY_CACHE_SIZE,
+    FUNCTION_CACHE_ENABLED,
+    FUNCTION_CACHE_SIZE,
+    FUNCTION_CACHE_TTL,
+    DYNAMODB_MAX_POOL_CONNECTIONS,
+    DYNAMODB_CONNECT_TIMEOUT,
+    DYNAMODB_READ_TIMEOUT,
+    DYNAMODB_MAX_RETRIES,
+    EVALUATION_CACHE_TABLE,
+    METRICS_ENABLED,
+)
+from cache import LRUCache
+from metrics import instrument_dynamodb
+from VersionTree import with_version_tree
+from archive import archived_call_count, iter_archived_calls, read_archived_calls
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 
 oauth2_scheme = HTTPBearer()
-session = boto3.Session(
+session = aioboto3.Session(
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
 )
-dynamodb = session.resource("dynamodb", region_name="us-east-1")
-user_table = dynamodb.Table("userbase")
+dynamodb_config = BotoConfig(
+    max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS,
+    connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+    read_timeout=DYNAMODB_READ_TIMEOUT,
+    retries={"max_attempts": DYNAMODB_MAX_RETRIES, "mode": "adaptive"},
+)
+_exit_stack = AsyncExitStack()
+
+# Tables are bound by connect_dynamodb() when the app starts
+dynamodb = None
+user_table = None
+enterprise_table = None
+# api_key -> username index, kept up to date by auth.login
+api_key_table = None
+# One item per function: PK username, SK function_key
+function_table = None
+# Append-only call log: PK function_version ("function_key#version"),
+# SK call_sort_key ("timestamp#call_key"), GSI call_key-index on call_key
+calls_table = None
+# Score aggregates: PK function_version ("function_key#version"), SK metric.
+# Fields are counters maintained with ADD, see rollups.py.
+rollups_table = None
+# Optional persistent evaluation cache: PK cache_key, DynamoDB TTL on expires_at
+evaluation_cache_table = None
+
+# api keys never change owner, so resolved usernames can be cached indefinitely
+api_key_cache = LRUCache(API_KEY_CACHE_SIZE)
+# Read-through cache of function items keyed by (username, function_key).
+# update_function invalidates entries; the TTL bounds staleness across workers.
+function_cache = LRUCache(FUNCTION_CACHE_SIZE if FUNCTION_CACHE_ENABLED else 0, ttl=FUNCTION_CACHE_TTL)
+
+
+class StorageStats:
+    """Storage round trips made while serving one request."""
+
+    def __init__(self):
+        self.round_trips = 0
+
+
+# Set per request by the middleware in main.py
+storage_stats: ContextVar[Optional[StorageStats]] = ContextVar("storage_stats", default=None)
+
+
+def record_round_trip(count: int = 1):
+    stats = storage_stats.get()
+    if stats is not None:
+        stats.round_trips += count
+
+
+async def connect_dynamodb():
+    global dynamodb, user_table, enterprise_table, api_key_table, function_table, calls_table
+    global evaluation_cache_table, rollups_table
+    dynamodb = await _exit_stack.enter_async_context(
+        session.resource("dynamodb", region_name=AWS_REGION, config=dynamodb_config)
+    )
+    if METRICS_ENABLED:
+        instrument_dynamodb(dynamodb.meta.client)
+    user_table = await dynamodb.Table("userbase")
+    enterprise_table = await dynamodb.Table("enterprise_requests")
+    api_key_table = await dynamodb.Table("api_keys")
+    function_table = await dynamodb.Table("functions")
+    calls_table = await dynamodb.Table("calls")
+    rollups_table = await dynamodb.Table("score_rollups")
+    if EVALUATION_CACHE_TABLE:
+        evaluation_cache_table = await dynamodb.Table(EVALUATION_CACHE_TABLE)
+
 
+async def close_dynamodb():
+    await _exit_stack.aclose()
 
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
@@ -35,40 +131,48 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(oauth2_sche
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         )
 
-def get_user(username: str):
-    response = user_table.get_item(Key={"username": username})
+async def get_user(username: str):
+    record_round_trip()
+    response = await user_table.get_item(Key={"username": username})
     if "Item" not in response:
         return None
     return response["Item"]
 
 
-def save_user(user_data: Dict[str, Any]):
+async def save_user(user_data: Dict[str, Any]):
     # print("Saving user data:", user_data["functions"][10])
-    user_table.put_item(Item=user_data)
+    record_round_trip()
+    await user_table.put_item(Item=user_data)
 
 
-def save_function(api_key, function):
-    user_data = find_user_by_api_key(api_key)
-    if not user_data:
-        raise HTTPException(status_code=401, detail="Invalid API key")
+async def get_cached_evaluation(cache_key: str) -> Optional[Dict[str, Any]]:
+    if evaluation_cache_table is None:
+        return None
+    record_round_trip()
+    response = await evaluation_cache_table.get_item(Key={"cache_key": cache_key})
+    item = response.get("Item")
+    # DynamoDB deletes expired items lazily, so check the expiry here too
+    if item is None or item["expires_at"] <= int(time.time()):
+        return None
+    return item["evaluation"]
 
-    functions = user_data.get("functions", [])
-    function_index = next(
-        (
-            i
-            for i, f in enumerate(functions)
-            if f.get("function_key") == function["function_key"]
-        ),
-        None,
+
+async def save_cached_evaluation(cache_key: str, evaluation: Dict[str, Any], ttl: float):
+    if evaluation_cache_table is None:
+        return
+    record_round_trip()
+    await evaluation_cache_table.put_item(
+        Item={
+            "cache_key": cache_key,
+            "evaluation": to_dynamo(evaluation),
+            "expires_at": int(time.time() + ttl),
+        }
     )
 
-    if function_index is not None:
-        functions[function_index] = function
-    else:
-        functions.append(function)
 
-    user_data["functions"] = functions
-    save_user(user_data)
+async def save_enterprise_request(request: Dict[str, Any]):
+    record_round_trip()
+    await enterprise_table.put_item(Item=request)
 
 
 def get_max_tests(tier: str) -> int:
@@ -90,23 +194,518 @@ def generate_api_key():
     return secrets.token_hex(16)
 
 
-# Add the new function
-def find_user_by_api_key(api_key: str):
-    scan_kwargs = {
-        "FilterExpression": Attr("api_key").eq(api_key),
+async def save_api_key(api_key: str, username: str):
+    record_round_trip()
+    await api_key_table.put_item(Item={"api_key": api_key, "username": username})
+    api_key_cache.set(api_key, username)
+
+
+async def find_username_by_api_key(api_key: str) -> Optional[str]:
+    if not api_key:
+        return None
+    username = api_key_cache.get(api_key)
+    if username is not None:
+        return username
+    record_round_trip()
+    response = await api_key_table.get_item(Key={"api_key": api_key})
+    if "Item" not in response:
+        return None
+    username = response["Item"]["username"]
+    api_key_cache.set(api_key, username)
+    return username
+
+
+async def find_user_by_api_key(api_key: str):
+    username = await find_username_by_api_key(api_key)
+    if not username:
+        return None
+    user_data = await get_user(username)
+    if not user_data or user_data.get("api_key") != api_key:
+        # The key was rotated or the user removed; drop the stale entry
+        api_key_cache.pop(api_key)
+        return None
+    return user_data
+
+
+async def find_function_by_api_and_function_key(api_key: str, function_key: str):
+    username = await find_username_by_api_key(api_key)
+    if not username:
+        return None
+    return await load_function(username, function_key)
+
+
+def to_dynamo(value: Any) -> Any:
+    # DynamoDB rejects floats, so convert them to Decimal recursively
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_dynamo(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_dynamo(v) for v in value]
+    return value
+
+
+def _projection(attributes: List[str]) -> Dict[str, Any]:
+    return {
+        "ProjectionExpression": ", ".join(f"#a{i}" for i in range(len(attributes))),
+        "ExpressionAttributeNames": {f"#a{i}": a for i, a in enumerate(attributes)},
     }
-    response = user_table.scan(**scan_kwargs)
-    if "Items" not in response or len(response["Items"]) == 0:
+
+
+async def load_functions(username: str, attributes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    kwargs = {"KeyConditionExpression": Key("username").eq(username)}
+    if attributes:
+        kwargs.update(_projection(attributes))
+    record_round_trip()
+    response = await function_table.query(**kwargs)
+    functions = response.get("Items", [])
+    while "LastEvaluatedKey" in response:
+        record_round_trip()
+        response = await function_table.query(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        functions.extend(response.get("Items", []))
+    return functions
+
+
+async def load_function(
+    username: str,
+    function_key: str,
+    attributes: Optional[List[str]] = None,
+    consistent: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Load a function item, or only the given top-level `attributes` of it.
+
+    `consistent` bypasses the cache and makes a strongly consistent read.
+    """
+    cache_key = (username, function_key)
+    function = None if consistent else function_cache.get(cache_key)
+    if function is None:
+        generation = function_cache.generation(cache_key)
+        kwargs = {"Key": {"username": username, "function_key": function_key}}
+        if attributes:
+            # Partial items are not cached; project at the storage layer instead
+            kwargs.update(_projection(attributes))
+        if consistent or not attributes:
+            # What is cached must not predate the last write, which an
+            # eventually consistent read could return for some time after it
+            kwargs["ConsistentRead"] = True
+        record_round_trip()
+        response = await function_table.get_item(**kwargs)
+        function = response.get("Item")
+        if function is None or attributes:
+            return function
+        # Skipped if update_function invalidated the key during the read
+        function_cache.set(cache_key, function, generation)
+    if attributes:
+        function = {a: function[a] for a in attributes if a in function}
+    # Callers mutate what they load, so never hand out the cached object
+    return copy.deepcopy(function)
+
+
+async def create_function_item(username: str, function: Dict[str, Any]) -> bool:
+    try:
+        record_round_trip()
+        await function_table.put_item(
+            Item={**function, "username": username, "revision": 1},
+            ConditionExpression="attribute_not_exists(function_key)",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+    return True
+
+
+def _expression_path(path: Tuple[str, ...], names: Dict[str, str]) -> str:
+    placeholders = []
+    for part in path:
+        placeholder = f"#n{len(names)}"
+        names[placeholder] = part
+        placeholders.append(placeholder)
+    return ".".join(placeholders)
+
+
+async def update_function(
+    username: str,
+    function_key: str,
+    updates: Dict[Tuple[str, ...], Any],
+    must_exist: Iterable[Tuple[str, ...]] = (),
+    appends: Optional[Dict[Tuple[str, ...], List[Any]]] = None,
+    must_not_exist: Iterable[Tuple[str, ...]] = (),
+    removes: Iterable[Tuple[str, ...]] = (),
+) -> bool:
+    """SET only the given attribute paths on a function item.
+
+    `updates` maps attribute paths, e.g. ("version_map", version, "parameters"),
+    to new values, `appends` maps list paths to items appended to them, and
+    `removes` lists paths to delete. Every path in `must_exist` has to be
+    present, and none in `must_not_exist`, for the write to apply.
+    Returns False if the function or a required path is missing, or a
+    forbidden one present.
+    Each write bumps the function's revision counter, which backs its ETags.
+    """
+    names, values, assignments = {"#revision": "revision"}, {":one": 1}, []
+    for i, (path, value) in enumerate(updates.items()):
+        values[f":v{i}"] = to_dynamo(value)
+        assignments.append(f"{_expression_path(path, names)} = :v{i}")
+    for i, (path, items) in enumerate((appends or {}).items()):
+        values[f":a{i}"] = to_dynamo(items)
+        expression_path = _expression_path(path, names)
+        assignments.append(f"{expression_path} = list_append({expression_path}, :a{i})")
+    conditions = ["attribute_exists(function_key)"] + [
+        f"attribute_exists({_expression_path(path, names)})" for path in must_exist
+    ] + [
+        f"attribute_not_exists({_expression_path(path, names)})" for path in must_not_exist
+    ]
+    removals = [_expression_path(path, names) for path in removes]
+    expression = "SET " + ", ".join(assignments)
+    if removals:
+        expression += " REMOVE " + ", ".join(removals)
+    try:
+        record_round_trip()
+        await function_table.update_item(
+            Key={"username": username, "function_key": function_key},
+            UpdateExpression=expression + " ADD #revision :one",
+            ConditionExpression=" AND ".join(conditions),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+    finally:
+        function_cache.pop((username, function_key))
+    return True
+
+
+def call_partition_key(function_key: str, version: str) -> str:
+    return f"{function_key}#{version}"
+
+
+def call_sort_key(timestamp: str, call_key: str) -> str:
+    return f"{timestamp}#{call_key}"
+
+
+def _strip_call_keys(item: Dict[str, Any]) -> Dict[str, Any]:
+    item.pop("function_version", None)
+    item.pop("call_sort_key", None)
+    return item
+
+
+def _call_item(function_key: str, version: str, call: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **to_dynamo(call),
+        "function_version": call_partition_key(function_key, version),
+        "call_sort_key": call_sort_key(call["timestamp"], call["call_key"]),
+        "function_key": function_key,
+        "version": version,
+    }
+
+
+async def put_call(function_key: str, version: str, call: Dict[str, Any]):
+    record_round_trip()
+    await calls_table.put_item(Item=_call_item(function_key, version, call))
+
+
+async def put_calls(function_key: str, version: str, calls: List[Dict[str, Any]]):
+    await put_call_batch([(function_key, version, call) for call in calls])
+
+
+async def put_call_batch(calls: List[Tuple[str, str, Dict[str, Any]]]):
+    """Write (function_key, version, call) records across any functions."""
+    async with calls_table.batch_writer() as batch:
+        for function_key, version, call in calls:
+            await batch.put_item(Item=_call_item(function_key, version, call))
+    # batch_writer flushes in BatchWriteItem requests of up to 25 items
+    record_round_trip(-(-len(calls) // 25))
+
+
+async def find_call(call_key: str, function_key: str = None, version: str = None, timestamp: str = None):
+    if function_key and version and timestamp:
+        record_round_trip()
+        response = await calls_table.get_item(
+            Key={
+                "function_version": call_partition_key(function_key, version),
+                "call_sort_key": call_sort_key(timestamp, call_key),
+            }
+        )
+        item = response.get("Item")
+    else:
+        record_round_trip()
+        response = await calls_table.query(
+            IndexName="call_key-index",
+            KeyConditionExpression=Key("call_key").eq(call_key),
+            Limit=1,
+        )
+        items = response.get("Items", [])
+        item = items[0] if items else None
+    if not item:
         return None
-    return response["Items"][0]
+    if function_key and item.get("function_key") != function_key:
+        return None
+    return item
+
+
+async def update_call_fields(call: Dict[str, Any], fields: Dict[str, Any]) -> bool:
+    """Overwrite the given attributes of an existing call item.
 
+    `call` must carry the storage keys, e.g. an item returned by find_call.
+    Returns False if the call no longer exists.
+    """
+    fields = {k: v for k, v in fields.items() if v is not None}
+    if not fields:
+        return True
+    names = {f"#{k}": k for k in fields}
+    values = {f":{k}": to_dynamo(v) for k, v in fields.items()}
+    try:
+        record_round_trip()
+        await calls_table.update_item(
+            Key={
+                "function_version": call["function_version"],
+                "call_sort_key": call["call_sort_key"],
+            },
+            UpdateExpression="SET " + ", ".join(f"#{k} = :{k}" for k in fields),
+            ConditionExpression="attribute_exists(call_sort_key)",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+    return True
+
+
+async def get_calls(function_key: str, version: str) -> List[Dict[str, Any]]:
+    kwargs = {
+        "KeyConditionExpression": Key("function_version").eq(
+            call_partition_key(function_key, version)
+        ),
+    }
+    record_round_trip()
+    response = await calls_table.query(**kwargs)
+    calls = response.get("Items", [])
+    while "LastEvaluatedKey" in response:
+        record_round_trip()
+        response = await calls_table.query(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        calls.extend(response.get("Items", []))
+    return [_strip_call_keys(c) for c in calls]
+
+
+async def get_call_scores(function_key: str, version: str) -> List[Dict[str, Any]]:
+    """Every call of a version, archived ones included, reduced to its inputs and evaluation."""
+    # Outputs and logs dominate item size and aren't needed to compare scores
+    return [
+        call
+        async for call in iter_calls(function_key, version, attributes=["inputs", "evaluation"], page_size=1000)
+    ]
 
-def find_function_by_api_and_function_key(api_key: str, function_key: str):
-    user_data = find_user_by_api_key(api_key)
-    if not user_data:
+
+async def add_score_rollups(function_key: str, version: str, deltas: Dict[str, Dict[str, float]]):
+    """ADD counter deltas to each metric's rollup for a version."""
+
+    async def add(metric, delta):
+        names = {f"#f{i}": field for i, field in enumerate(delta)}
+        values = {f":v{i}": to_dynamo(amount) for i, amount in enumerate(delta.values())}
+        record_round_trip()
+        await rollups_table.update_item(
+            Key={"function_version": call_partition_key(function_key, version), "metric": metric},
+            UpdateExpression="ADD " + ", ".join(f"#f{i} :v{i}" for i in range(len(delta))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+    await asyncio.gather(*(add(metric, delta) for metric, delta in deltas.items() if delta))
+
+
+async def get_score_rollups(function_key: str, version: str) -> Dict[str, Dict[str, Any]]:
+    # A version has one item per metric, so this is a single small query
+    record_round_trip()
+    response = await rollups_table.query(
+        KeyConditionExpression=Key("function_version").eq(call_partition_key(function_key, version))
+    )
+    return {item.pop("metric"): item for item in response.get("Items", [])}
+
+
+def encode_cursor(last_evaluated_key: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not last_evaluated_key:
         return None
-    functions = user_data.get("functions", [])
-    function = next(
-        (f for f in functions if f.get("function_key") == function_key), None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def query_calls(
+    function_key: str,
+    version: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Return one page of calls, newest first, and the cursor for the next page."""
+    partition = call_partition_key(function_key, version)
+    kwargs = {
+        "KeyConditionExpression": Key("function_version").eq(partition),
+        "ScanIndexForward": False,
+    }
+    if statuses:
+        kwargs["FilterExpression"] = Attr("status").is_in(statuses)
+    start_key = decode_cursor(cursor) if cursor else None
+    if start_key and (not isinstance(start_key, dict) or start_key.get("function_version") != partition):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    calls = []
+    if start_key and "archived_before" in start_key:
+        # An earlier page reached the end of the table; continue in the archive
+        before = start_key["archived_before"]
+    else:
+        before = start_key["call_sort_key"] if start_key else None
+        # Filters apply after Limit, so keep reading until the page is full
+        while True:
+            page_kwargs = dict(kwargs, Limit=limit - len(calls))
+            if start_key:
+                page_kwargs["ExclusiveStartKey"] = start_key
+            record_round_trip()
+            response = await calls_table.query(**page_kwargs)
+            calls.extend(response.get("Items", []))
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key or len(calls) >= limit:
+                break
+        if start_key:
+            return [_strip_call_keys(c) for c in calls], encode_cursor(start_key)
+        if calls:
+            before = calls[-1]["call_sort_key"]
+        calls = [_strip_call_keys(c) for c in calls]
+
+    # Archived calls are all older than the ones in the table
+    archived, more = await asyncio.to_thread(
+        read_archived_calls, function_key, version, limit - len(calls), before, statuses
     )
+    calls.extend(archived)
+    if not more:
+        return calls, None
+    if calls:
+        before = call_sort_key(calls[-1]["timestamp"], calls[-1]["call_key"])
+    return calls, encode_cursor({"function_version": partition, "archived_before": before})
+
+
+async def iter_calls(
+    function_key: str,
+    version: str,
+    statuses: Optional[List[str]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    page_size: int = 500,
+    attributes: Optional[List[str]] = None,
+):
+    """Yield a version's calls newest first, from the table then the archive.
+
+    `since` (inclusive) and `until` (exclusive) are ISO timestamps. Only one
+    page is held at a time, however many calls there are. `attributes`
+    limits each call to those fields.
+    """
+
+    def project(call):
+        return call if attributes is None else {k: call[k] for k in attributes if k in call}
+
+    sort_key = Key("call_sort_key")
+    condition = Key("function_version").eq(call_partition_key(function_key, version))
+    if since and until:
+        condition &= sort_key.between(since, until)
+    elif since:
+        condition &= sort_key.gte(since)
+    elif until:
+        condition &= sort_key.lt(until)
+    kwargs = {"KeyConditionExpression": condition, "ScanIndexForward": False, "Limit": page_size}
+    if statuses:
+        kwargs["FilterExpression"] = Attr("status").is_in(statuses)
+    if attributes is not None:
+        # call_sort_key is needed to continue into the archive
+        projected = sorted(set(attributes) | {"call_sort_key"})
+        kwargs["ProjectionExpression"] = ", ".join(f"#p{i}" for i in range(len(projected)))
+        kwargs["ExpressionAttributeNames"] = {f"#p{i}": name for i, name in enumerate(projected)}
+
+    before = until
+    start_key = None
+    while True:
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        record_round_trip()
+        response = await calls_table.query(**kwargs)
+        for item in response.get("Items", []):
+            before = item["call_sort_key"]
+            yield project(_strip_call_keys(item))
+        start_key = response.get("LastEvaluatedKey")
+        if not start_key:
+            break
+
+    # Archived calls are all older than the ones in the table. The segments
+    # are read a page at a time off the event loop.
+    archived = iter_archived_calls(function_key, version, before, statuses)
+    while True:
+        calls = await asyncio.to_thread(lambda: list(itertools.islice(archived, page_size)))
+        for call in calls:
+            if since and call["timestamp"] < since:
+                return
+            yield project(call)
+        if len(calls) < page_size:
+            return
+
+
+async def attach_calls(function: Dict[str, Any]) -> Dict[str, Any]:
+    # Rebuild the legacy embedded "calls" lists for dashboard responses. They
+    # hold the calls still in the table; "archived_calls" counts the ones
+    # compaction has moved out, which the paginated calls listing returns.
+    version_map = function.get("version_map", {})
+    results = await asyncio.gather(
+        *(get_calls(function["function_key"], version) for version in version_map)
+    )
+    archived = await asyncio.gather(
+        *(asyncio.to_thread(archived_call_count, function["function_key"], version) for version in version_map)
+    )
+    for version_data, calls, count in zip(version_map.values(), results, archived):
+        version_data["calls"] = version_data.get("calls", []) + calls
+        version_data["archived_calls"] = count
+    return function
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
+async def load_function_fields(
+    username: str, function_key: str, fields: Optional[List[str]]
+) -> Optional[Dict[str, Any]]:
+    """Load a function for a read endpoint, honouring a `fields=` selection.
+
+    Without fields the full function is returned with calls reattached.
+    "calls" is a pseudo-field that reattaches calls to the selected version_map.
+    """
+    if fields is None:
+        function = await load_function(username, function_key)
+        return await attach_calls(with_version_tree(function)) if function else None
+    with_calls = "calls" in fields
+    attributes = [f for f in fields if f != "calls"]
+    if with_calls:
+        attributes += [a for a in ("function_key", "version_map") if a not in attributes]
+    if "version_tree" in fields:
+        # The nested tree is derived from the flat index
+        attributes += [a for a in ("version_index", "root_version") if a not in attributes]
+    function = await load_function(username, function_key, attributes)
+    if not function:
+        return function
+    if "version_tree" in fields:
+        with_version_tree(function)
+        for a in ("version_index", "root_version"):
+            if a not in fields:
+                function.pop(a, None)
+    if with_calls:
+        await attach_calls(function)
     return function
@@ -18,7 +18,9 @@ import CallItem from "./CallItem";
 
 const Logs = ({ functionId, versionName }) => {
   const [callsForFunction, setCallsForFunction] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const { userEmail, tier } = useContext(AuthContext);
 
   // Snackbar state
@@ -37,27 +39,10 @@ const Logs = ({ functionId, versionName }) => {
   const fetchCallsForFunctionAndVersion = async () => {
     setLoading(true);
     try {
-      // Fetch the function data using the new API method
-      const func_response = await api.getFunctionData(functionId);
-      const func = func_response.data;
-
-      if (!func) {
-        setCallsForFunction([]);
-        setLoading(false);
-        return;
-      }
-
-      // Access the version data directly from version_map
-      const versionData = func.version_map[versionName];
-
-      if (!versionData || !versionData.calls) {
-        setCallsForFunction([]);
-        setLoading(false);
-        return;
-      }
-
-      // Reverse the array to show the latest calls first
-      setCallsForFunction(versionData.calls.slice().reverse());
+      // Fetch the first page of calls, latest first
+      const response = await api.listCalls(functionId, versionName);
+      setCallsForFunction(response.data.calls);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error("Error fetching calls:", error);
       setSnackbar({
@@ -66,11 +51,30 @@ const Logs = ({ functionId, versionName }) => {
         severity: "error",
       });
       setCallsForFunction([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
   };
 
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await api.listCalls(functionId, versionName, nextCursor);
+      setCallsForFunction((calls) => [...calls, ...response.data.calls]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error("Error fetching calls:", error);
+      setSnackbar({
+        open: true,
+        message: "Error fetching logs.",
+        severity: "error",
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleRefresh = () => {
     fetchCallsForFunctionAndVersion();
   };
@@ -163,6 +167,13 @@ const Logs = ({ functionId, versionName }) => {
       {callsForFunction.map((call, index) => (
         <CallItem key={index} call={call} index={index} />
       ))}
+      {nextCursor && (
+        <Box display="flex" justifyContent="center" mt={2}>
+          <Button variant="outlined" onClick={handleLoadMore} disabled={loadingMore}>
+            {loadingMore ? <CircularProgress size={24} /> : "Load more"}
+          </Button>
+        </Box>
+      )}
 
       {/* Snackbar for Notifications */}
       <Snackbar
@@ -19,14 +19,21 @@ const VersionTree = ({ functionId, onVersionSelect, currentVersion }) => {
 
   const fetchVersionTree = async () => {
     try {
-      const func_response = await api.get(
-        `/users/${encodeURIComponent(userEmail)}/function/${functionId}`
-      );
+      const [func_response, summary_response] = await Promise.all([
+        api.get(
+          `/users/${encodeURIComponent(userEmail)}/function/${functionId}`,
+          { params: { fields: "function_key,version_tree,version_map" } }
+        ),
+        api.get(
+          `/users/${encodeURIComponent(userEmail)}/functions/${functionId}/summary`
+        ),
+      ]);
       const func = func_response.data.function;
       if (!func) return;
       setFunctionKey(func.function_key);
       const versionMap = func.version_map;
-      const tree = convertVersionTree(func.version_tree, versionMap);
+      const summaries = summary_response.data.versions || {};
+      const tree = convertVersionTree(func.version_tree, versionMap, summaries);
       setVersionTreeData(tree);
     } catch (error) {
       console.error("Error fetching version tree:", error);
@@ -42,42 +49,26 @@ const VersionTree = ({ functionId, onVersionSelect, currentVersion }) => {
     }
   };
 
-  // Function to compute average score for a version
-  const computeAverageScore = (versionData) => {
-    const calls = versionData.calls || [];
-    let totalScore = 0;
-    let scoreCount = 0;
-
-    calls.forEach((call) => {
-      if (call.evaluation && call.evaluation.scores) {
-        const scores = call.evaluation.scores;
-        Object.values(scores).forEach((value) => {
-          if (typeof value === "number") {
-            totalScore += value;
-            scoreCount += 1;
-          }
-        });
-      }
-    });
-
-    if (scoreCount === 0) return null;
-    return totalScore / scoreCount;
+  // Average of every score recorded for a version, from its rollup summary
+  const averageScore = (summary) => {
+    const overall = summary && summary.overall;
+    if (!overall || !overall.count) return null;
+    return overall.mean;
   };
 
   // Convert version tree to the format expected by react-d3-tree
-  const convertVersionTree = (node, versionMap) => {
+  const convertVersionTree = (node, versionMap, summaries) => {
     const versionData = versionMap[node.name] || {};
-    const averageScore = computeAverageScore(versionData);
     const newNode = {
       name: node.name,
       versionName: node.name,
       label: `${node.name.slice(0, 6)}...`,
       attributes: {
-        averageScore: averageScore,
+        averageScore: averageScore(summaries[node.name]),
         date: versionData.date || "",
       },
       children: node.children
-        ? node.children.map((child) => convertVersionTree(child, versionMap))
+        ? node.children.map((child) => convertVersionTree(child, versionMap, summaries))
         : [],
     };
     return newNode;
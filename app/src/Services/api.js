@@ -44,6 +44,13 @@ api.getFunctionData = (functionKey) => {
   return api.get(`/function_data/${functionKey}`);
 };
 
+// Function to list one page of calls for a version, newest first
+api.listCalls = (functionKey, version, cursor, limit = 50) => {
+  return api.get(`/calls/${functionKey}/${version}`, {
+    params: { limit, cursor },
+  });
+};
+
 // Function to create a call
 api.createCall = (functionKey, version, data) => {
   return api.post(`/create_call/${functionKey}/${version}`, data);
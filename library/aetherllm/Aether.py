@@ -1,14 +1,29 @@
 # library/Aether.py
 from .AetherAPI import AetherAPI
 from .AetherFunction import AetherFunction
+from .AetherSubscription import AetherSubscription
 
 
 class Aether:
     def __init__(self, api_key):
         self.api_key = api_key
         self.api = AetherAPI(api_key)
+        # Its own session and ETag cache; requests.Session isn't thread-safe
+        self.subscription = AetherSubscription(AetherAPI(api_key))
 
     def __call__(self, function_key, version=None, openai_key=None):
         function = AetherFunction(function_key, self.api, version, openai_key)
         function.init()
+        self.subscription.add(function)
         return function
+
+    def close(self):
+        # Stop the background event stream
+        self.subscription.close()
+        self.api.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,8 +1,16 @@
 import os
+import copy
+import json
 import requests
 import aiohttp
 from dotenv import load_dotenv
 
+# Optional: smaller, faster-to-decode bodies from endpoints that support it
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 load_dotenv()
 
 BASE_URL = os.getenv("AETHER_BASE_URL")
@@ -12,16 +20,41 @@ if not BASE_URL:
 class AetherAPI:
     def __init__(self, api_key):
         self.api_key = api_key
+        self.session = requests.Session()
+        # (url, params) -> (etag, body) for conditional GETs
+        self._etag_cache = {}
 
-    def getParameters(self, function):
+    def _get_json(self, url, error, params=None):
+        # Revalidate cached bodies with If-None-Match; a 304 costs no payload
         headers = {"X-API-Key": self.api_key}
-        response = requests.get(
-            f"{BASE_URL}/function_params/{function.function_key}/{function.version}",
-            headers=headers,
-        )
+        cache_key = (url, tuple(sorted((params or {}).items())))
+        cached = self._etag_cache.get(cache_key)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+        if msgpack is not None:
+            headers["Accept"] = "application/msgpack, application/json"
+        response = self.session.get(url, headers=headers, params=params)
+        if response.status_code == 304 and cached is not None:
+            return copy.deepcopy(cached[1])
         if response.status_code != 200:
-            raise Exception(f"Error retrieving parameters: {response.text}")
-        parameters = response.json()["parameters"]
+            raise Exception(f"{error}: {response.text}")
+        if response.headers.get("Content-Type", "").startswith("application/msgpack"):
+            body = msgpack.unpackb(response.content)
+        else:
+            body = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            self._etag_cache[cache_key] = (etag, body)
+            return copy.deepcopy(body)
+        return body
+
+    def getParameters(self, function, version=None):
+        version = function.version if version is None else version
+        response = self._get_json(
+            f"{BASE_URL}/function_params/{function.function_key}/{version}",
+            "Error retrieving parameters",
+        )
+        parameters = response["parameters"]
         return parameters
 
     def getParameter(self, function, parameter):
@@ -51,14 +84,66 @@ class AetherAPI:
         return response.json()
 
     def getCurrentVersion(self, function):
+        function_data = self._get_json(
+            f"{BASE_URL}/function_data/{function.function_key}",
+            "Error retrieving function data",
+            params={"fields": "current_version"},
+        )
+        return function_data["current_version"]
+
+    def openFunctionEvents(self, function_keys):
+        headers = {"X-API-Key": self.api_key, "Accept": "text/event-stream"}
+        response = requests.get(
+            f"{BASE_URL}/function_events",
+            headers=headers,
+            params={"function_keys": ",".join(function_keys)},
+            stream=True,
+            timeout=(10, 60),
+        )
+        if response.status_code != 200:
+            raise Exception(f"Error subscribing to function events: {response.text}")
+        return response
+
+    def getCalls(self, function, version, limit=50, cursor=None, status=None):
         headers = {"X-API-Key": self.api_key}
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        if status:
+            params["status"] = status
         response = requests.get(
-            f"{BASE_URL}/function_data/{function.function_key}", headers=headers
+            f"{BASE_URL}/calls/{function.function_key}/{version}",
+            headers=headers,
+            params=params,
         )
         if response.status_code != 200:
-            raise Exception(f"Error retrieving function data: {response.text}")
-        function_data = response.json()
-        return function_data["current_version"]
+            raise Exception(f"Error retrieving calls: {response.text}")
+        page = response.json()
+        return page["calls"], page["next_cursor"]
+
+    def exportCalls(self, function_key, versions=None, status=None, since=None, until=None):
+        # Streams the export as NDJSON and yields one call at a time
+        headers = {"X-API-Key": self.api_key}
+        params = {"format": "ndjson"}
+        if versions:
+            params["versions"] = ",".join(versions)
+        if status:
+            params["status"] = status
+        if since:
+            params["since"] = since
+        if until:
+            params["until"] = until
+        with self.session.get(
+            f"{BASE_URL}/export_calls/{function_key}",
+            headers=headers,
+            params=params,
+            stream=True,
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"Error exporting calls: {response.text}")
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
 
     def createCall(self, function, version, inputs, outputs, logs):
         headers = {"X-API-Key": self.api_key}
@@ -70,8 +155,24 @@ class AetherAPI:
         )
         if response.status_code != 200:
             raise Exception(f"Error creating call: {response.text}")
-        call_key = response.json()["call_key"]
-        return call_key
+        return response.json()
+
+    def createCalls(self, records):
+        # records: iterable of dicts with function_key, version, inputs, outputs
+        # and optionally logs, evaluation and status. They are streamed to the
+        # server as NDJSON; returns one {"line", "call_key" | "error"} per record.
+        headers = {"X-API-Key": self.api_key, "Content-Type": "application/x-ndjson"}
+
+        def body():
+            for record in records:
+                yield (json.dumps(record) + "\n").encode()
+
+        response = self.session.post(
+            f"{BASE_URL}/create_calls", headers=headers, data=body()
+        )
+        if response.status_code != 200:
+            raise Exception(f"Error creating calls: {response.text}")
+        return response.json()["results"]
 
     async def updateCall(self, call):
         headers = {"X-API-Key": self.api_key}
@@ -83,6 +184,7 @@ class AetherAPI:
             "evaluation": call.evaluation,
             "function_key": call.function_key,
             "version": call.version,
+            "timestamp": call.timestamp,
         }
         async with aiohttp.ClientSession() as session:
             async with session.post(
@@ -100,6 +202,9 @@ class AetherAPI:
             "logs": call.logs,
             "status": call._status,
             "evaluation": call.evaluation,
+            "function_key": call.function_key,
+            "version": call.version,
+            "timestamp": call.timestamp,
         }
         response = requests.post(
             f"{BASE_URL}/update_call/{call.call_key}", headers=headers, json=payload
@@ -115,6 +220,7 @@ class AetherAPI:
             "outputs": call.outputs,
             "logs": call.logs,
             "status": call._status,
+            "timestamp": call.timestamp,
         }
 
         async with aiohttp.ClientSession() as session:
@@ -123,19 +229,26 @@ class AetherAPI:
                 headers=headers,
                 json=payload,
             ) as response:
-                if response.status_code != 200:
-                    raise Exception(f"Error evaluating call: {response.text}")
-                evaluation = response.json()["evaluation"]
-                return evaluation
+                if response.status != 200:
+                    raise Exception(f"Error evaluating call: {await response.text()}")
+                # Grading runs in the background and writes the evaluation to
+                # the call; returns {"job_id", "status"} to poll with getJob
+                return await response.json()
 
-    def getFunctionData(self, function_key):
+    def getJob(self, job_id):
         headers = {"X-API-Key": self.api_key}
-        response = requests.get(
-            f"{BASE_URL}/function_data/{function_key}", headers=headers
-        )
+        response = self.session.get(f"{BASE_URL}/jobs/{job_id}", headers=headers)
         if response.status_code != 200:
-            raise Exception(f"Error retrieving function data: {response.text}")
-        function_data = response.json()
+            raise Exception(f"Error retrieving job: {response.text}")
+        return response.json()
+
+    def getFunctionData(self, function_key, fields=None):
+        params = {"fields": ",".join(fields)} if fields else None
+        function_data = self._get_json(
+            f"{BASE_URL}/function_data/{function_key}",
+            "Error retrieving function data",
+            params=params,
+        )
         return function_data
 
     async def updateVersionTree(self, function, parent_version, params):
@@ -16,15 +16,19 @@ class AetherCall:
         self.logs = []
         self.evaluation = {}
         self._status = "pending"
+        self.timestamp = None
 
     def init(self):
-        self.call_key = self.api.createCall(
+        response = self.api.createCall(
             self.function,
             self.version,
             self.inputs,
             self.outputs,
             self.logs,
         )
+        self.call_key = response["call_key"]
+        # The server keys calls by timestamp, so send it back on updates
+        self.timestamp = response.get("timestamp")
 
     def status(self, _status):
         self._status = _status
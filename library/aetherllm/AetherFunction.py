@@ -1,10 +1,22 @@
 # library/_Aether/AetherFunction.py
 from .AetherCall import AetherCall
+from .AetherSchema import compile_schema
 from openai import OpenAI
 import threading
 import json
 from decimal import Decimal
 
+# Attributes fetched when the function is initialized; the rest load lazily
+INIT_FIELDS = [
+    "name",
+    "task",
+    "type",
+    "input_schema",
+    "output_schema",
+    "metrics",
+    "current_version",
+]
+
 
 class AetherFunction:
     def __init__(self, function_key, api, version=None, openai_key=None):
@@ -16,10 +28,15 @@ class AetherFunction:
         if openai_key is not None:
             self.openai = OpenAI(api_key=openai_key)
         self.current = version == None
+        self.subscription = None
+        self._revision = None
+        # Version and parameters change together, possibly from the
+        # subscription thread
+        self._lock = threading.Lock()
         self.init()
 
     def init(self):
-        function_data = self.api.getFunctionData(self.function_key)
+        function_data = self.api.getFunctionData(self.function_key, INIT_FIELDS)
         self.version = (
             function_data["current_version"] if self.version is None else self.version
         )
@@ -29,23 +46,57 @@ class AetherFunction:
         self.parameters = self.api.getParameters(self)
         self.input_schema = function_data["input_schema"]
         self.output_schema = function_data["output_schema"]
+        # Compiled once per schema, not per call
+        self.compiled_input_schema = (
+            compile_schema(self.input_schema) if self.input_schema else None
+        )
+        self.compiled_output_schema = (
+            compile_schema(self.output_schema) if self.output_schema else None
+        )
         self.metrics = function_data["metrics"]
-        self.test_set = function_data["test_set"]
-        self.version_map = function_data["version_map"]
-        self.version_tree = function_data["version_tree"]
+        self._details = None
+
+    def _load_details(self):
+        if self._details is None:
+            self._details = self.api.getFunctionData(
+                self.function_key, ["test_set", "version_map", "version_tree"]
+            )
+        return self._details
+
+    @property
+    def test_set(self):
+        return self._load_details()["test_set"]
+
+    @property
+    def version_map(self):
+        return self._load_details()["version_map"]
+
+    @property
+    def version_tree(self):
+        return self._load_details()["version_tree"]
 
     def __call__(self, input_json, eval=True):
         if self.openai_key is None:
             raise Exception("OpenAI key not set")
+        # Reject bad inputs before anything is sent to the server or OpenAI
+        if self.compiled_input_schema is not None:
+            self.compiled_input_schema.check(input_json, "input")
 
-        call = self.init_call()
+        version, params = self._snapshot()
+        call = self.init_call(version)
         for key in input_json:
             call.input(key, input_json[key])
-        params = self.get_parameters()
-        old_schema = self.output_schema
-        output_schema = self.convert_output_schema_to_openai_function_definition(
-            old_schema
-        )
+        prompt = params["prompt"]
+        if self.compiled_output_schema is not None:
+            response_format = {
+                "type": "json_schema",
+                "json_schema": self.compiled_output_schema.openai_definition("output"),
+            }
+        else:
+            # No output schema: any JSON object. OpenAI's JSON mode requires
+            # the messages to ask for JSON.
+            response_format = {"type": "json_object"}
+            prompt += "\n\nRespond with a JSON object."
         input = f"{json.dumps(input_json)}"
         # print("input_json", type(input_json), input_json)
 
@@ -54,14 +105,21 @@ class AetherFunction:
         response = self.openai.chat.completions.create(
             model=params["model"],
             messages=[
-                {"role": "system", "content": params["prompt"]},
+                {"role": "system", "content": prompt},
                 {"role": "user", "content": input},
             ],
             temperature=float(params["temperature"]),
-            response_format={"type": "json_schema", "json_schema": output_schema},
+            response_format=response_format,
         )
 
         output = json.loads(response.choices[0].message.content)
+        errors = (
+            self.compiled_output_schema.validate(output)
+            if self.compiled_output_schema is not None
+            else None
+        )
+        if errors:
+            call.log({"message": "Output does not match the output schema", "errors": errors})
         for key in output:
             call.output(key, output[key])
 
@@ -74,46 +132,69 @@ class AetherFunction:
     def get_version(self):
         return self.version
 
-    def init_call(self):
-        if self.current:
-            current_version = self.api.getCurrentVersion(self)
-            if self.version != current_version:
-                self.version = current_version
-                self.parameters = self.api.getParameters(self)
-
-        call = AetherCall(self, self.version, self.api)
+    def _sync_version(self):
+        # A live subscription pushes deploys to on_update, so only poll without one
+        if not self.current or (self.subscription and self.subscription.connected):
+            return
+        current_version = self.api.getCurrentVersion(self)
+        if self.version != current_version:
+            parameters = self.api.getParameters(self, current_version)
+            with self._lock:
+                self.version, self.parameters = current_version, parameters
+
+    def _snapshot(self):
+        # A version and the parameters that belong to it
+        self._sync_version()
+        with self._lock:
+            return self.version, self.parameters
+
+    def on_update(self, event, api):
+        # Called from the subscription thread when the function changes, with
+        # that thread's own `api`
+        revision = event["revision"]
+        if revision == self._revision:
+            return
+        self._revision = revision
+        version = event["current_version"] if self.current else self.version
+        # Fetch first, so the new version is never paired with old parameters
+        parameters = api.getParameters(self, version)
+        with self._lock:
+            self.version, self.parameters = version, parameters
+
+    def calls(self, version=None, status=None, page_size=50):
+        # Iterate over logged calls, newest first, one page at a time
+        version = version or self.version
+        cursor = None
+        while True:
+            calls, cursor = self.api.getCalls(self, version, page_size, cursor, status)
+            yield from calls
+            if not cursor:
+                return
+
+    def export_calls(self, versions=None, status=None, since=None, until=None):
+        # Iterate over every call of `versions` (default: all), streamed in one
+        # request; since/until are ISO timestamps
+        return self.api.exportCalls(self.function_key, versions, status, since, until)
+
+    def init_call(self, version=None):
+        if version is None:
+            version, _ = self._snapshot()
+
+        call = AetherCall(self, version, self.api)
         call.init()
         return call
 
     def get_parameters(self):
         # print("current", self.current)
-        if self.current:
-            # print("Getting current version data")
-            current_version = self.api.getCurrentVersion(self)
-            if self.version != current_version:
-                self.version = current_version
-                self.parameters = self.api.getParameters(self)
-        return self.parameters
+        return self._snapshot()[1]
 
     def __getitem__(self, item):
         # print("current", self.current)
-        if self.current:
-            # print("Getting current version data")
-            current_version = self.api.getCurrentVersion(self)
-            if self.version != current_version:
-                self.version = current_version
-                self.parameters = self.api.getParameters(self)
-        return self.parameters[item]
+        return self._snapshot()[1][item]
 
     def __setitem__(self, item, value):
         # print("current", self.current)
-        if self.current:
-            # print("Getting current version data")
-            current_version = self.api.getCurrentVersion(self)
-            if self.version != current_version:
-                self.version = current_version
-                self.parameters = self.api.getParameters(self)
-        self.parameters[item] = value
+        self._snapshot()[1][item] = value
         self.api.setParameter(self, item, value)
 
     def __str__(self):
@@ -123,27 +204,4 @@ class AetherFunction:
         return self.name
 
     def convert_output_schema_to_openai_function_definition(self, output_schema):
-        # Remove 'metrics' fields and 'title'
-        cleaned_schema = {}
-
-        def clean_schema(schema):
-            if isinstance(schema, dict):
-                schema = schema.copy()
-                schema.pop("metrics", None)
-                schema.pop("title", None)
-                schema.pop("description", None)
-                if "properties" in schema:
-                    schema["properties"] = {
-                        k: clean_schema(v) for k, v in schema["properties"].items()
-                    }
-                    schema["additionalProperties"] = False
-                if "items" in schema:
-                    schema["items"] = clean_schema(schema["items"])
-                if "required" not in schema and "properties" in schema:
-                    schema["required"] = list(schema["properties"].keys())
-            return schema
-
-        cleaned_schema["schema"] = clean_schema(output_schema)
-        cleaned_schema["name"] = "output"
-        cleaned_schema["strict"] = True
-        return cleaned_schema
+        return compile_schema(output_schema).openai_definition("output")
@@ -0,0 +1,109 @@
+# library/_Aether/AetherSchema.py
+#
+# Function input/output schemas compiled once per distinct schema: the
+# cleaned schema OpenAI structured outputs accept, plus a reusable
+# validator. The server has a matching module, api/CompiledSchema.py;
+# api/tests/test_schema.py checks the two stay in step.
+
+import hashlib
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+import jsonschema
+
+# Optional: generated-code validators when fastjsonschema is installed
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# Dashboard annotations that aren't JSON Schema
+ANNOTATION_KEYS = ("title", "metrics", "desiredProperties")
+
+CACHE_SIZE = 128
+
+
+class SchemaValidationError(ValueError):
+    def __init__(self, what, errors):
+        super().__init__(f"Invalid {what}: " + "; ".join(errors))
+        self.errors = errors
+
+
+def _canonical(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    return str(obj)
+
+
+def schema_hash(schema):
+    payload = json.dumps(schema, sort_keys=True, separators=(",", ":"), default=_canonical)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def clean_schema(schema):
+    # Strip annotations and make every object strict, as structured outputs require
+    if not isinstance(schema, dict):
+        return schema
+    schema = {k: v for k, v in schema.items() if k not in ANNOTATION_KEYS}
+    if "properties" in schema:
+        schema["properties"] = {k: clean_schema(v) for k, v in schema["properties"].items()}
+        if "required" not in schema:
+            schema["required"] = list(schema["properties"].keys())
+    if "items" in schema:
+        schema["items"] = clean_schema(schema["items"])
+    if schema.get("type") == "object" or "properties" in schema:
+        schema["additionalProperties"] = False
+    return schema
+
+
+class AetherSchema:
+    def __init__(self, schema, hash=None):
+        self.schema = schema
+        self.hash = hash or schema_hash(schema)
+        self.cleaned = clean_schema(schema)
+        # Validate against the schema as written; cleaning only tightens
+        # what the model may produce
+        validated = json.loads(json.dumps(schema, default=_canonical))
+        if fastjsonschema is not None:
+            self._fast = fastjsonschema.compile(validated)
+            self._validator = None
+        else:
+            self._fast = None
+            self._validator = jsonschema.validators.validator_for(validated)(validated)
+
+    def openai_definition(self, name):
+        return {"name": name, "schema": self.cleaned, "strict": True}
+
+    def validate(self, value):
+        # A message per problem with `value`; empty if it is valid
+        if self._fast is not None:
+            try:
+                self._fast(value)
+            except fastjsonschema.JsonSchemaException as e:
+                return [e.message]
+            return []
+        return [
+            f"{'/'.join(str(p) for p in error.absolute_path) or '<root>'}: {error.message}"
+            for error in self._validator.iter_errors(value)
+        ]
+
+    def check(self, value, what="value"):
+        errors = self.validate(value)
+        if errors:
+            raise SchemaValidationError(what, errors)
+
+
+_cache = OrderedDict()
+
+
+def compile_schema(schema):
+    key = schema_hash(schema)
+    compiled = _cache.get(key)
+    if compiled is None:
+        compiled = _cache[key] = AetherSchema(schema, key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return compiled
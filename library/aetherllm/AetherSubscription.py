@@ -0,0 +1,88 @@
+# library/_Aether/AetherSubscription.py
+import json
+import threading
+
+
+class AetherSubscription:
+    """Background stream of deploys and parameter changes for an Aether client.
+
+    Keeps one server-sent events connection open for every function created
+    through the client and updates those functions in place, so calls in
+    `current` mode don't need to poll for the deployed version. `api` is
+    used only from the subscription thread, so it must not be shared with
+    the caller's. close() ends the stream.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.functions = {}
+        self.connected = False
+        self._lock = threading.Lock()
+        self._response = None
+        self._thread = None
+        self._closed = threading.Event()
+
+    def add(self, function):
+        if self._closed.is_set():
+            return
+        with self._lock:
+            self.functions.setdefault(function.function_key, []).append(function)
+        function.subscription = self
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        elif self._response is not None:
+            # Reconnect so the stream covers the new function key
+            self._response.close()
+
+    def close(self):
+        self._closed.set()
+        response = self._response
+        if response is not None:
+            # Unblocks the thread's read of the stream
+            response.close()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.api.session.close()
+
+    def _run(self):
+        delay = 1
+        while not self._closed.is_set():
+            with self._lock:
+                function_keys = list(self.functions)
+            try:
+                self._response = self.api.openFunctionEvents(function_keys)
+                if self._closed.is_set():
+                    # close() ran while connecting
+                    self._response.close()
+                    break
+                self.connected = True
+                delay = 1
+                for event in self._events(self._response):
+                    self._apply(event)
+            except Exception:
+                pass
+            finally:
+                self.connected = False
+            with self._lock:
+                reconnect = list(self.functions) != function_keys
+            if not reconnect:
+                self._closed.wait(delay)
+                delay = min(delay * 2, 30)
+
+    def _events(self, response):
+        data = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            elif line == "" and data:
+                yield json.loads("\n".join(data))
+                data = []
+
+    def _apply(self, event):
+        with self._lock:
+            functions = list(self.functions.get(event["function_key"], []))
+        for function in functions:
+            function.on_update(event, self.api)